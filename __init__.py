@@ -1 +1,12 @@
-from . import models
\ No newline at end of file
+from odoo.tools import config
+
+from . import controllers
+from . import models
+from . import services
+
+
+def post_init_hook(env):
+    # Partitioning of modbus_data is opt-in: set modbus_data_partitioning = True
+    # in the Odoo configuration file before installing the module
+    if str(config.get('modbus_data_partitioning', '')).lower() in ('1', 'true', 'yes'):
+        env['modbus.data']._setup_partitioning()
@@ -1,6 +1,6 @@
 {
     'name': 'Modbus Connector',
-    'version': '1.0',
+    'version': '1.1',
     'category': 'Industrial Automation',
     'summary': 'Connect Modbus devices to Odoo using a REST API',
     'description': """
@@ -11,18 +11,28 @@
         - Monitor device status
         - Automatic data polling
         - Historical data tracking
+        - Downsampled trends (1 minute, 1 hour, 1 day) with per-tier retention
     """,
     'author': 'Chimera',
     'website': 'https://petra.ac.id/',
-    'depends': ['base'],
+    'depends': ['base', 'bus'],
     'data': [
         'security/ir.model.access.csv',
         'views/modbus_device_views.xml',
         'views/modbus_data_views.xml',
+        'views/modbus_data_summary_views.xml',
+        'views/modbus_poll_stats_views.xml',
+        'data/ir_cron.xml',
     ],
+    'assets': {
+        'web.assets_backend': [
+            'modbus_connector/static/src/js/bulk_results.js',
+        ],
+    },
     'external_dependencies': {
         'python': ['requests'],
     },
+    'post_init_hook': 'post_init_hook',
     'installable': True,
     'application': True,
     'auto_install': False,
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""End-to-end benchmark of the Modbus polling path.
+
+Starts a simulated fleet of Modbus TCP slaves (``server/simulator.js``) and a
+bridge, creates polling devices for them in a dedicated database and runs the
+poll scheduler in this process, so every sample goes through the real path:
+scheduler -> bridge -> simulated PLC -> ingestion into ``modbus.data``.
+
+    python bench/run_bench.py -c odoo.conf -d modbus_bench --devices 200 --registers 20 \\
+        --interval-ms 1000 --duration 60 --json result.json
+
+Arguments this script does not know are passed on to Odoo. Use a database
+where the module is installed and no Odoo server is polling: the benchmark
+devices are created and deleted again (``--keep`` keeps them).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+import odoo
+from odoo import api, SUPERUSER_ID
+from odoo.tools import config
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'server')
+DEVICE_PREFIX = '[bench] '
+STAGES = ('bridge_http', 'plc_read', 'decode', 'db_write', 'dispatch', 'cycle')
+# Report keys where higher is better, checked against a baseline with --baseline
+THROUGHPUT_KEYS = ('polls_per_s', 'rows_per_s')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, allow_abbrev=False,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, default=50, help="Number of simulated devices")
+    parser.add_argument('--registers', type=int, default=10, help="Holding registers read per device")
+    parser.add_argument('--interval-ms', type=int, default=1000, help="Polling interval of every device")
+    parser.add_argument('--latency-ms', type=float, default=5, help="Response time of the simulated PLCs")
+    parser.add_argument('--jitter-ms', type=float, default=0, help="Random extra response time, 0 to this")
+    parser.add_argument('--slaves-per-port', type=int, default=1,
+                        help="Devices sharing one TCP endpoint as slave ids, like behind a serial gateway")
+    parser.add_argument('--max-in-flight', type=int, default=1, help="Max Requests In Flight of the devices")
+    parser.add_argument('--warmup', type=float, default=10, help="Seconds polled before measuring")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds measured")
+    parser.add_argument('--base-port', type=int, default=15020, help="First TCP port of the simulated slaves")
+    parser.add_argument('--api-port', type=int, default=3101, help="Port of the bridge")
+    parser.add_argument('--no-bridge', action='store_true',
+                        help="Use a bridge already listening on --api-port instead of starting one")
+    parser.add_argument('--keep', action='store_true', help="Keep the benchmark devices and their data")
+    parser.add_argument('--json', metavar='PATH', help="Write the report to this file")
+    parser.add_argument('--baseline', metavar='PATH',
+                        help="Report of an earlier run; exit with status 1 if this run is slower")
+    parser.add_argument('--tolerance', type=float, default=10,
+                        help="Slowdown against the baseline (%%) tolerated, default 10")
+    args, odoo_args = parser.parse_known_args()
+    config.parse_config(odoo_args)
+    if not config['db_name']:
+        parser.error("the benchmark database must be given with -d")
+    return args
+
+
+def start_simulator(args):
+    process = subprocess.Popen(
+        ['node', 'simulator.js',
+         '--devices', str(args.devices),
+         '--registers', str(args.registers),
+         '--latency-ms', str(args.latency_ms),
+         '--jitter-ms', str(args.jitter_ms),
+         '--interval-ms', str(args.interval_ms),
+         '--slaves-per-port', str(args.slaves_per_port),
+         '--base-port', str(args.base_port)],
+        cwd=SERVER_DIR, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line or not json.loads(line).get('ready'):
+        raise RuntimeError("The Modbus simulator did not start")
+    return process
+
+
+def simulator_command(process, command):
+    """Send a command to the simulator and return its JSON answer."""
+    process.stdin.write(command + '\n')
+    process.stdin.flush()
+    return json.loads(process.stdout.readline())
+
+
+def start_bridge(args, buffer_dir):
+    env = dict(os.environ, API_PORT=str(args.api_port), LOG_LEVEL='warn', BUFFER_DIR=buffer_dir)
+    process = subprocess.Popen(['node', 'modbusapi.js'], cwd=SERVER_DIR, env=env)
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f'http://localhost:{args.api_port}/metrics', timeout=1).raise_for_status()
+            return process
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"The Modbus bridge did not start on port {args.api_port}")
+
+
+def check_no_other_poller(registry, lock_key):
+    with registry.cursor() as cr:
+        cr.execute("""
+            SELECT pid FROM pg_locks
+             WHERE locktype = 'advisory' AND classid = 0 AND objid = %s AND objsubid = 1 AND granted
+        """, (lock_key,))
+        row = cr.fetchone()
+    if row:
+        raise RuntimeError(f"Another Odoo process (backend pid {row[0]}) polls database {registry.db_name}; "
+                           "stop it or benchmark on a dedicated database")
+
+
+def delete_bench_devices(registry):
+    with registry.cursor() as cr:
+        env = api.Environment(cr, SUPERUSER_ID, {})
+        env['modbus.device'].search([('name', '=like', DEVICE_PREFIX + '%')]).unlink()
+        cr.commit()
+
+
+def create_devices(registry, args):
+    with registry.cursor() as cr:
+        env = api.Environment(cr, SUPERUSER_ID, {})
+        devices = env['modbus.device'].create([{
+            'name': f'{DEVICE_PREFIX}{index:05d}',
+            'plc_ip': '127.0.0.1',
+            'plc_port': args.base_port + index // args.slaves_per_port,
+            'slave_id': index % args.slaves_per_port + 1,
+            'polling_interval': args.interval_ms,
+            'starting_register': 0,
+            'number_of_registers': args.registers,
+            'api_port': args.api_port,
+            'max_in_flight': args.max_in_flight,
+            # Every sample is a row, so rows/s follows the poll rate
+            'storage_policy': 'all',
+        } for index in range(args.devices)])
+        # The computed URL targets a bridge reached from a container
+        cr.execute("UPDATE modbus_device SET api_url = %s WHERE id IN %s",
+                   (f'http://localhost:{args.api_port}', tuple(devices.ids)))
+        devices.invalidate_recordset(['api_url'])
+        devices.write({'is_polling': True, 'status': 'polling'})
+        cr.commit()
+        return devices.ids
+
+
+def last_data_id(registry):
+    with registry.cursor() as cr:
+        cr.execute("SELECT COALESCE(MAX(id), 0) FROM modbus_data")
+        return cr.fetchone()[0]
+
+
+def count_rows(registry, device_ids, after_id):
+    with registry.cursor() as cr:
+        cr.execute("SELECT COUNT(*) FROM modbus_data WHERE id > %s AND device_id IN %s",
+                   (after_id, tuple(device_ids)))
+        return cr.fetchone()[0]
+
+
+def run(args, registry):
+    # The addons can only be imported once the configuration (addons path) is loaded
+    from odoo.addons.modbus_connector.services import metrics
+    from odoo.addons.modbus_connector.services.poll_scheduler import SCHEDULER_LOCK_KEY, get_scheduler
+
+    check_no_other_poller(registry, SCHEDULER_LOCK_KEY)
+    delete_bench_devices(registry)
+    device_ids = create_devices(registry, args)
+    scheduler = get_scheduler(registry.db_name)
+    scheduler.start()
+    scheduler.wakeup()
+    try:
+        print(f"Polling {args.devices} devices every {args.interval_ms} ms, "
+              f"warming up for {args.warmup:g}s", file=sys.stderr)
+        time.sleep(args.warmup)
+
+        metrics.reset(registry.db_name)
+        simulator_command(args.simulator, 'reset')
+        start_id = last_data_id(registry)
+        start = time.monotonic()
+        print(f"Measuring for {args.duration:g}s", file=sys.stderr)
+        time.sleep(args.duration)
+        elapsed = time.monotonic() - start
+        plc = simulator_command(args.simulator, 'report')
+        stages = metrics.summarize(registry.db_name, device_ids)
+    finally:
+        with registry.cursor() as cr:
+            cr.execute("UPDATE modbus_device SET is_polling = false WHERE id IN %s", (tuple(device_ids),))
+            cr.commit()
+        scheduler.wakeup()
+    # Rows of the last polls are committed shortly after the window
+    time.sleep(1)
+    rows = count_rows(registry, device_ids, start_id)
+
+    polls = stages.get('cycle', (0,))[0]
+    scheduled_per_s = args.devices * 1000.0 / args.interval_ms
+    report = {
+        'config': {key: getattr(args, key) for key in (
+            'devices', 'registers', 'interval_ms', 'latency_ms', 'jitter_ms',
+            'slaves_per_port', 'max_in_flight', 'duration')},
+        'elapsed_s': round(elapsed, 3),
+        'polls': polls,
+        'polls_per_s': round(polls / elapsed, 1),
+        'scheduled_polls_per_s': round(scheduled_per_s, 1),
+        # Polls that never reached the PLCs, e.g. skipped because the previous read was still running
+        'missed_polls_pct': round(max(0.0, 1 - plc['polls'] / (scheduled_per_s * elapsed)) * 100, 2),
+        'registers_per_s': round(polls * args.registers / elapsed, 1),
+        'rows': rows,
+        'rows_per_s': round(rows / elapsed, 1),
+        'plc_requests_per_s': round(plc['requests'] / elapsed, 1),
+        'jitter_ms': {key: round(value, 2) if value is not None else None for key, value in plc['jitterMs'].items()},
+        'stages_ms': {
+            stage: {
+                'count': count,
+                'p50': round(p50 * 1000, 2),
+                'p95': round(p95 * 1000, 2),
+                'p99': round(p99 * 1000, 2),
+                'max': round(maximum * 1000, 2),
+            }
+            for stage, (count, p50, p95, p99, maximum) in sorted(stages.items(), key=lambda item: STAGES.index(item[0]))
+        },
+    }
+    if not args.keep:
+        delete_bench_devices(registry)
+    return report
+
+
+def print_report(report):
+    print(f"Polls:      {report['polls_per_s']}/s of {report['scheduled_polls_per_s']}/s scheduled "
+          f"({report['missed_polls_pct']}% missed), {report['registers_per_s']} registers/s")
+    print(f"PLC:        {report['plc_requests_per_s']} requests/s")
+    print(f"Database:   {report['rows_per_s']} rows/s ({report['rows']} rows)")
+    jitter = report['jitter_ms']
+    print(f"Jitter:     p50 {jitter['p50']} ms, p95 {jitter['p95']} ms, p99 {jitter['p99']} ms, max {jitter['max']} ms")
+    print(f"{'Stage':<12}{'count':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for stage, stats in report['stages_ms'].items():
+        print(f"{stage:<12}{stats['count']:>9}{stats['p50']:>10}{stats['p95']:>10}{stats['p99']:>10}{stats['max']:>10}")
+
+
+def compare(report, baseline, tolerance):
+    """Return the lines describing the regressions of ``report`` against ``baseline``."""
+    regressions = []
+    factor = tolerance / 100.0
+    for key in THROUGHPUT_KEYS:
+        if report[key] < baseline[key] * (1 - factor):
+            regressions.append(f"{key}: {report[key]} < {baseline[key]}")
+    for stage, stats in report['stages_ms'].items():
+        previous = baseline['stages_ms'].get(stage)
+        if previous and stats['p95'] > previous['p95'] * (1 + factor):
+            regressions.append(f"{stage} p95: {stats['p95']} ms > {previous['p95']} ms")
+    return regressions
+
+
+def main():
+    args = parse_args()
+    # The registry hook of modbus.device starts the scheduler outside test mode, which
+    # would take the polling lock before run() checks that no other process holds it
+    test_enable = config['test_enable']
+    config['test_enable'] = True
+    try:
+        registry = odoo.registry(config['db_name'])
+    finally:
+        config['test_enable'] = test_enable
+    bridge = None
+    args.simulator = start_simulator(args)
+    try:
+        with tempfile.TemporaryDirectory(prefix='modbus-bench-') as buffer_dir:
+            if not args.no_bridge:
+                bridge = start_bridge(args, buffer_dir)
+            try:
+                report = run(args, registry)
+            finally:
+                if bridge:
+                    bridge.terminate()
+                    bridge.wait()
+    finally:
+        args.simulator.terminate()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"Regression: {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
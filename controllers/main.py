@@ -0,0 +1,123 @@
+import csv
+import io
+import json
+import re
+from contextlib import closing
+from datetime import datetime, timezone
+
+from werkzeug.exceptions import BadRequest, NotFound
+
+from odoo import http, api
+from odoo.http import request, content_disposition
+
+BUCKET_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    # One JSON object of columns per line, e.g. {"timestamp": [...], "value": [...]}
+    'json': 'application/x-ndjson',
+}
+
+
+def parse_datetime(value, name):
+    """Parse an ISO 8601 date or datetime into a naive UTC datetime; naive values are UTC."""
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        raise BadRequest(f"{name} must be an ISO 8601 datetime, e.g. 2024-03-14T12:00:00Z")
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def parse_ids(value, name):
+    try:
+        return [int(item) for item in value.split(',') if item.strip()] if value else []
+    except ValueError:
+        raise BadRequest(f"{name} must be a comma separated list of integers")
+
+
+def parse_bucket(value):
+    """Parse a bucket size like ``900``, ``15m``, ``1h`` or ``1d`` into seconds."""
+    if not value:
+        return None
+    match = re.fullmatch(r'\s*(\d+)\s*([smhd]?)\s*', value)
+    if not match or not int(match.group(1)):
+        raise BadRequest("bucket must be a positive number of seconds, optionally followed by s, m, h or d")
+    return int(match.group(1)) * BUCKET_UNITS[match.group(2)]
+
+
+def format_cell(value):
+    if isinstance(value, datetime):
+        return value.isoformat() + 'Z'
+    return value
+
+
+class ModbusDataExport(http.Controller):
+
+    @http.route('/modbus/data/export', type='http', auth='user', methods=['GET'])
+    def export_data(self, device_ids=None, date_from=None, date_to=None, registers=None, tags=None,
+                    bucket=None, format='csv', **kwargs):
+        """Stream the history of Modbus devices as CSV or column chunks of JSON.
+
+        ``device_ids``, ``registers`` (register numbers) and ``tags``
+        (modbus.register ids) are comma separated lists, ``date_from`` and
+        ``date_to`` ISO 8601 datetimes (UTC when no offset is given), and
+        ``bucket`` an optional aggregation period such as ``60``, ``15m`` or
+        ``1d``.
+        """
+        if format not in CONTENT_TYPES:
+            raise BadRequest(f"format must be one of {', '.join(CONTENT_TYPES)}")
+        ids = parse_ids(device_ids, 'device_ids')
+        if not ids:
+            raise BadRequest("device_ids is required")
+        if not date_from or not date_to:
+            raise BadRequest("date_from and date_to are required")
+        date_from = parse_datetime(date_from, 'date_from')
+        date_to = parse_datetime(date_to, 'date_to')
+        register_numbers = parse_ids(registers, 'registers')
+        register_ids = parse_ids(tags, 'tags')
+        bucket = parse_bucket(bucket)
+
+        # Checked with the request environment: the rows are read with raw SQL
+        devices = request.env['modbus.device'].browse(ids).exists()
+        if not devices:
+            raise NotFound("None of these devices exists")
+        devices.check_access('read')
+        request.env['modbus.data'].check_access('read')
+
+        # The response is generated after this method returns, once the
+        # request cursor is gone: read through a cursor of its own
+        registry, uid, context = request.env.registry, request.env.uid, dict(request.env.context)
+        device_ids = devices.ids
+
+        def generate():
+            with registry.cursor() as cr:
+                env = api.Environment(cr, uid, context)
+                columns, chunks = env['modbus.data']._export_series(
+                    device_ids, date_from, date_to, register_numbers, register_ids, bucket)
+                with closing(chunks):
+                    if format == 'csv':
+                        yield self._csv_lines([columns])
+                        for rows in chunks:
+                            yield self._csv_lines(rows)
+                    else:
+                        for rows in chunks:
+                            yield self._json_chunk(columns, rows)
+
+        filename = f"modbus_data_{date_from:%Y%m%d%H%M%S}_{date_to:%Y%m%d%H%M%S}.{format}"
+        return request.make_response(generate(), headers=[
+            ('Content-Type', CONTENT_TYPES[format]),
+            ('Content-Disposition', content_disposition(filename)),
+        ])
+
+    def _csv_lines(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows([format_cell(value) for value in row] for row in rows)
+        return buffer.getvalue().encode()
+
+    def _json_chunk(self, columns, rows):
+        chunk = {
+            column: [format_cell(value) for value in values]
+            for column, values in zip(columns, zip(*rows))
+        }
+        return (json.dumps(chunk) + '\n').encode()
@@ -0,0 +1,8 @@
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    # data_count became a stored counter and the latest values a table: fill
+    # both once from the existing history
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env['modbus.device'].with_context(active_test=False).search([])._recount_data()
@@ -1,2 +1,7 @@
 from . import modbus_data
-from . import modbus_device
\ No newline at end of file
+from . import modbus_data_latest
+from . import modbus_data_summary
+from . import modbus_device
+from . import modbus_poll_stats
+from . import modbus_register
+from . import modbus_stream_cursor
@@ -1,7 +1,20 @@
 import requests
 from odoo import models, fields, api
 from odoo.exceptions import UserError, ValidationError
-from datetime import datetime
+from collections import Counter
+from datetime import datetime, timedelta
+from dateutil.relativedelta import relativedelta
+import logging
+
+from ..services.historian import StorageFilter
+from .modbus_data_summary import DEFAULT_RETENTION_DAYS, TIER_SECONDS
+
+_logger = logging.getLogger(__name__)
+
+# Months of partitions created ahead of time when modbus_data is partitioned
+PARTITIONS_AHEAD = 2
+# Rows fetched at a time from the server-side cursor of an export
+EXPORT_CHUNK_SIZE = 10000
 
 class ModbusData(models.Model):
     _name = 'modbus.data'
@@ -11,11 +24,361 @@ class ModbusData(models.Model):
     device_id = fields.Many2one('modbus.device', string='Device', required=True, ondelete='cascade')
     timestamp = fields.Datetime(string='Timestamp', required=True, default=fields.Datetime.now)
     register_number = fields.Integer(string='Register Number', required=True)
+    register_id = fields.Many2one('modbus.register', string='Tag', ondelete='set null')
     value = fields.Float(string='Value')
     error = fields.Text(string='Error Message')
 
+    def init(self):
+        self._create_indexes()
+
+    def _create_indexes(self):
+        cr = self.env.cr
+        # History of one register of a device, newest first (views, exports, monitors)
+        cr.execute("""
+            CREATE INDEX IF NOT EXISTS modbus_data_device_register_timestamp_idx
+            ON modbus_data (device_id, register_number, "timestamp" DESC)
+        """)
+        # History of a whole device, newest first (device views, clearing)
+        cr.execute("""
+            CREATE INDEX IF NOT EXISTS modbus_data_device_timestamp_idx
+            ON modbus_data (device_id, "timestamp" DESC)
+        """)
+        # Time range scans of the rollup and retention jobs; rows arrive in time
+        # order, so a BRIN index stays tiny even at hundreds of millions of rows
+        cr.execute("""
+            CREATE INDEX IF NOT EXISTS modbus_data_timestamp_brin_idx
+            ON modbus_data USING brin ("timestamp")
+        """)
+
+    @api.model
+    def _is_partitioned(self):
+        self.env.cr.execute("SELECT relkind FROM pg_class WHERE relname = 'modbus_data'")
+        row = self.env.cr.fetchone()
+        return bool(row) and row[0] == 'p'
+
+    @api.model
+    def _setup_partitioning(self):
+        """Convert modbus_data to a table partitioned by month on ``timestamp``.
+
+        Existing rows are copied into the partitions. PostgreSQL requires the
+        partition key in the primary key, which becomes ``(id, timestamp)``.
+        Odoo stops managing the schema of a partitioned table, so columns added
+        to modbus.data later have to be added to the table by hand.
+        """
+        if self._is_partitioned():
+            return
+        cr = self.env.cr
+        self.flush_model()
+        cr.execute('SELECT MIN("timestamp") FROM modbus_data')
+        first_timestamp = cr.fetchone()[0] or fields.Datetime.now()
+
+        # The id sequence must survive the drop of the old table
+        cr.execute("ALTER SEQUENCE modbus_data_id_seq OWNED BY NONE")
+        cr.execute("ALTER TABLE modbus_data RENAME TO modbus_data_unpartitioned")
+        # Free the primary key name, index names are unique per schema
+        cr.execute("ALTER TABLE modbus_data_unpartitioned RENAME CONSTRAINT modbus_data_pkey TO modbus_data_unpartitioned_pkey")
+        cr.execute("""
+            CREATE TABLE modbus_data (LIKE modbus_data_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+            PARTITION BY RANGE ("timestamp")
+        """)
+        cr.execute('ALTER TABLE modbus_data ADD CONSTRAINT modbus_data_pkey PRIMARY KEY (id, "timestamp")')
+        for column, table, ondelete in (
+            ('device_id', 'modbus_device', 'CASCADE'),
+            ('register_id', 'modbus_register', 'SET NULL'),
+            ('create_uid', 'res_users', 'SET NULL'),
+            ('write_uid', 'res_users', 'SET NULL'),
+        ):
+            cr.execute(f"""
+                ALTER TABLE modbus_data ADD CONSTRAINT modbus_data_{column}_fkey
+                FOREIGN KEY ({column}) REFERENCES {table}(id) ON DELETE {ondelete}
+            """)
+        # Rows outside every monthly partition (e.g. late buffered samples) land here
+        cr.execute("CREATE TABLE modbus_data_default PARTITION OF modbus_data DEFAULT")
+        self._ensure_partitions(first_timestamp)
+
+        cr.execute("INSERT INTO modbus_data SELECT * FROM modbus_data_unpartitioned")
+        cr.execute("DROP TABLE modbus_data_unpartitioned")
+        cr.execute("ALTER SEQUENCE modbus_data_id_seq OWNED BY modbus_data.id")
+        self._create_indexes()
+        _logger.info("modbus_data is now partitioned by month")
+
+    @api.model
+    def _ensure_partitions(self, since=None):
+        """Create the monthly partitions from ``since`` (default: now) to a few months ahead.
+
+        Rows of a new month already in the default partition (e.g. samples
+        stamped ahead by a bridge clock) are moved into its partition, as
+        PostgreSQL refuses to create a partition overlapping default rows.
+        """
+        cr = self.env.cr
+        month = (since or fields.Datetime.now()).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        last_month = fields.Datetime.now().replace(day=1) + relativedelta(months=PARTITIONS_AHEAD)
+        while month <= last_month:
+            next_month = month + relativedelta(months=1)
+            partition = f"modbus_data_p{month:%Y_%m}"
+            cr.execute("SELECT to_regclass(%s)", (partition,))
+            if cr.fetchone()[0] is None:
+                cr.execute("""
+                    SELECT 1 FROM modbus_data_default WHERE "timestamp" >= %s AND "timestamp" < %s LIMIT 1
+                """, (month, next_month))
+                if cr.fetchone() is None:
+                    cr.execute(f"""
+                        CREATE TABLE {partition} PARTITION OF modbus_data
+                        FOR VALUES FROM (%s) TO (%s)
+                    """, (month, next_month))
+                else:
+                    # Indexes and foreign keys of modbus_data are added by the attach
+                    cr.execute(f"""
+                        CREATE TABLE {partition}
+                        (LIKE modbus_data INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+                    """)
+                    cr.execute(f"""
+                        WITH moved AS (
+                            DELETE FROM modbus_data_default
+                             WHERE "timestamp" >= %s AND "timestamp" < %s
+                         RETURNING *
+                        )
+                        INSERT INTO {partition} SELECT * FROM moved
+                    """, (month, next_month))
+                    _logger.info("Moved %s rows from modbus_data_default into %s", cr.rowcount, partition)
+                    cr.execute(f"""
+                        ALTER TABLE modbus_data ATTACH PARTITION {partition}
+                        FOR VALUES FROM (%s) TO (%s)
+                    """, (month, next_month))
+            month = next_month
+
+    @api.model
+    def _drop_expired_partitions(self, cutoff, max_id):
+        """Drop the monthly partitions entirely older than ``cutoff``.
+
+        A partition is only dropped when all its ids are at most ``max_id``,
+        i.e. were already rolled up. Returns the number of rows dropped per
+        device id.
+        """
+        cr = self.env.cr
+        cr.execute("""
+            SELECT c.relname
+              FROM pg_inherits i
+              JOIN pg_class c ON c.oid = i.inhrelid
+             WHERE i.inhparent = 'modbus_data'::regclass AND c.relname ~ '^modbus_data_p[0-9]{4}_[0-9]{2}$'
+          ORDER BY c.relname
+        """)
+        dropped = Counter()
+        for (partition,) in cr.fetchall():
+            month_end = datetime.strptime(partition[-7:], '%Y_%m') + relativedelta(months=1)
+            if month_end > cutoff:
+                break
+            cr.execute(f"SELECT COALESCE(MAX(id), 0) FROM {partition}")
+            if cr.fetchone()[0] > max_id:
+                break
+            cr.execute(f"SELECT device_id, COUNT(*) FROM {partition} GROUP BY device_id")
+            dropped.update(dict(cr.fetchall()))
+            cr.execute(f"DROP TABLE {partition}")
+        return dropped
+
     @api.constrains('value')
     def _check_value(self):
         for record in self:
             if record.value is not None and not isinstance(record.value, (int, float)):
-                raise ValidationError('Value must be a number')
\ No newline at end of file
+                raise ValidationError('Value must be a number')
+
+    @api.model
+    def _ingest_poll_results(self, poll_results, timestamp=None):
+        """Store the register values of one or more poll results in a single batch.
+
+        Each poll result is a dict with the keys ``device_id``, ``values`` (a
+        ``{register_number: value}`` dict) and optionally ``tag_values`` (a
+        ``{modbus.register id: value}`` dict), ``error`` and ``timestamp``.
+        Results of several devices can be flushed together; every row of a
+        poll shares one timestamp. Samples rejected by the storage policy of
+        their device or tag (change of value, deadband) are not written.
+        """
+        timestamp = timestamp or fields.Datetime.now()
+        # Read the policies of all devices and the addresses of all tags at once
+        devices = self.env['modbus.device'].browse({result['device_id'] for result in poll_results})
+        device_policies = {device.id: device._get_storage_policy() for device in devices}
+        tags = self.env['modbus.register'].browse(
+            [tag_id for result in poll_results for tag_id in (result.get('tag_values') or {})])
+        tag_infos = {tag.id: (tag.address, tag._get_storage_policy()) for tag in tags}
+
+        storage_filter = StorageFilter(self.env.cr.dbname)
+        vals_list = []
+        for result in poll_results:
+            device_id = result['device_id']
+            poll_timestamp = result.get('timestamp') or timestamp
+            policy = device_policies[device_id]
+            for register_number, value in result['values'].items():
+                if not storage_filter.accept((device_id, register_number, False), policy, value, poll_timestamp):
+                    continue
+                vals_list.append({
+                    'device_id': result['device_id'],
+                    'timestamp': poll_timestamp,
+                    'register_number': register_number,
+                    'value': value,
+                    'error': result.get('error'),
+                })
+            for tag_id, value in (result.get('tag_values') or {}).items():
+                address, tag_policy = tag_infos[tag_id]
+                if not storage_filter.accept((device_id, address, tag_id), tag_policy, value, poll_timestamp):
+                    continue
+                vals_list.append({
+                    'device_id': result['device_id'],
+                    'timestamp': poll_timestamp,
+                    'register_number': address,
+                    'register_id': tag_id,
+                    'value': value,
+                    'error': result.get('error'),
+                })
+        if not vals_list:
+            return self.browse()
+        # The last stored values only move forward once the rows are committed
+        self.env.cr.postcommit.add(storage_filter.commit)
+        # One create() call issues a single multi-row INSERT and runs the
+        # constraints once over the whole batch instead of once per register
+        return self.create(vals_list)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        # Keep the per-device counters and the latest value of each register up
+        # to date, so device views never have to scan the history
+        counts = {}
+        latest = []
+        for record, vals in zip(records, vals_list):
+            device_id = record.device_id.id
+            count, last_timestamp = counts.get(device_id, (0, record.timestamp))
+            counts[device_id] = (count + 1, max(last_timestamp, record.timestamp))
+            # The value from vals, as the ORM reads a NULL value back as 0.0
+            latest.append((device_id, record.register_number, record.register_id.id or None,
+                           vals.get('value'), record.timestamp))
+        self.env['modbus.device']._add_data_counts(counts)
+        self.env['modbus.data.latest']._upsert(latest)
+        return records
+
+    def unlink(self):
+        if not self:
+            return super().unlink()
+        self.flush_recordset()
+        self.env.cr.execute("""
+            SELECT device_id, register_number, register_id, COUNT(*)
+              FROM modbus_data
+             WHERE id IN %s
+          GROUP BY device_id, register_number, register_id
+        """, (tuple(self.ids),))
+        groups = self.env.cr.fetchall()
+        result = super().unlink()
+        deleted = Counter()
+        for device_id, _register_number, _register_id, count in groups:
+            deleted[device_id] += count
+        self.env['modbus.device']._add_data_counts(
+            {device_id: (-count, None) for device_id, count in deleted.items()})
+        self.env['modbus.data.latest']._refresh([group[:3] for group in groups])
+        self.env['modbus.device'].browse(list(deleted))._refresh_last_sample()
+        return result
+
+    @api.model
+    def _export_series(self, device_ids, date_from, date_to, register_numbers=None, register_ids=None,
+                       bucket=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """Read the history of registers in chunks, in constant memory.
+
+        Rows are read through a server-side cursor, ordered by device,
+        register and time, from ``date_from`` included to ``date_to``
+        excluded. Without ``bucket`` the rows are the stored samples; with a
+        bucket size in seconds they are the min, max, average and count of
+        each bucket, aligned on the Unix epoch.
+
+        Returns ``(columns, chunks)``, ``chunks`` being a generator of lists
+        of at most ``chunk_size`` row tuples. It reads through the cursor of
+        the environment, so it must be consumed (or closed) before that
+        cursor is.
+        """
+        self.check_access('read')
+        params = {
+            'device_ids': tuple(device_ids),
+            'date_from': date_from,
+            'date_to': date_to,
+            'register_numbers': tuple(register_numbers or ()),
+            'register_ids': tuple(register_ids or ()),
+            'bucket': bucket,
+            'tier': None,
+        }
+        source, time_column = 'modbus_data', '"timestamp"'
+        if bucket:
+            tier = self._get_export_tier(bucket, date_from)
+            if tier != 'raw':
+                source, time_column, params['tier'] = 'modbus_data_summary', 'bucket_start', tier
+        conditions = [
+            "device_id IN %(device_ids)s",
+            f"{time_column} >= %(date_from)s",
+            f"{time_column} < %(date_to)s",
+        ]
+        if params['tier']:
+            conditions.append("tier = %(tier)s")
+        if register_numbers:
+            conditions.append("register_number IN %(register_numbers)s")
+        if register_ids:
+            conditions.append("register_id IN %(register_ids)s")
+        where = ' AND '.join(conditions)
+
+        if not bucket:
+            columns = ['timestamp', 'device_id', 'register_number', 'register_id', 'value']
+            query = f"""
+                SELECT "timestamp", device_id, register_number, register_id, value
+                  FROM modbus_data
+                 WHERE {where}
+              ORDER BY device_id, register_number, register_id, "timestamp"
+            """
+        else:
+            columns = ['bucket_start', 'device_id', 'register_number', 'register_id', 'min', 'max', 'avg', 'count']
+            if params['tier']:
+                # Summary buckets fold into the wider export buckets exactly
+                aggregates = "MIN(value_min), MAX(value_max), SUM(value_avg * sample_count) / SUM(sample_count), SUM(sample_count)"
+            else:
+                aggregates = "MIN(value), MAX(value), AVG(value), COUNT(value)"
+            query = f"""
+                SELECT to_timestamp(floor(extract(epoch FROM {time_column}) / %(bucket)s) * %(bucket)s)
+                           AT TIME ZONE 'UTC' AS bucket,
+                       device_id, register_number, register_id, {aggregates}
+                  FROM {source}
+                 WHERE {where}
+              GROUP BY device_id, register_number, register_id, bucket
+              ORDER BY device_id, register_number, register_id, bucket
+            """
+        return columns, self._fetch_in_chunks(query, params, chunk_size)
+
+    @api.model
+    def _get_export_tier(self, bucket, date_from):
+        """Return the tier ('raw' or a summary tier) an export in buckets of ``bucket`` seconds reads.
+
+        Raw samples are used while they are retained. Older ranges are read
+        from the finest summary tier whose buckets fit in the export buckets
+        and that still covers ``date_from``.
+        """
+        summary = self.env['modbus.data.summary']
+        now = fields.Datetime.now()
+        raw_days = int(summary._get_param('retention_raw_days', DEFAULT_RETENTION_DAYS['raw']))
+        if not raw_days or date_from >= now - timedelta(days=raw_days):
+            return 'raw'
+        for tier, seconds in TIER_SECONDS.items():
+            if bucket % seconds:
+                continue
+            days = int(summary._get_param(f'retention_{tier}_days', DEFAULT_RETENTION_DAYS[tier]))
+            if not days or date_from >= now - timedelta(days=days):
+                return tier
+        # Nothing covers the whole range: export what is left of the samples
+        return 'raw'
+
+    def _fetch_in_chunks(self, query, params, chunk_size):
+        cr = self.env.cr
+        # A SQL cursor keeps the result on the database server: only one
+        # chunk at a time is transferred and held in memory
+        cr.execute(f"DECLARE modbus_data_export NO SCROLL CURSOR FOR {query}", params)
+        try:
+            while True:
+                cr.execute("FETCH FORWARD %s FROM modbus_data_export", (chunk_size,))
+                rows = cr.fetchall()
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cr.execute("CLOSE modbus_data_export")
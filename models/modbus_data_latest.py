@@ -0,0 +1,94 @@
+from odoo import models, fields, api
+
+
+class ModbusDataLatest(models.Model):
+    _name = 'modbus.data.latest'
+    _description = 'Modbus Latest Register Value'
+    _order = 'device_id, register_number'
+
+    device_id = fields.Many2one('modbus.device', string='Device', required=True, ondelete='cascade', readonly=True)
+    register_number = fields.Integer(string='Register Number', required=True, readonly=True)
+    register_id = fields.Many2one('modbus.register', string='Tag', ondelete='cascade', readonly=True)
+    value = fields.Float(string='Value', readonly=True)
+    timestamp = fields.Datetime(string='Timestamp', readonly=True)
+
+    def init(self):
+        # One row per register (or tag) of a device, target of the upserts
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS modbus_data_latest_register_uniq
+            ON modbus_data_latest (device_id, register_number, COALESCE(register_id, 0))
+        """)
+
+    @api.model
+    def _upsert(self, samples):
+        """Record the newest stored value of each register.
+
+        ``samples`` is a list of ``(device_id, register_number, register_id,
+        value, timestamp)``; ``register_id`` is None for raw registers. Older
+        samples never overwrite newer ones.
+        """
+        newest = {}
+        for sample in samples:
+            key = sample[:3]
+            # A single INSERT ... ON CONFLICT may not touch the same row twice
+            if key not in newest or sample[4] >= newest[key][4]:
+                newest[key] = sample
+        if not newest:
+            return
+        now = fields.Datetime.now()
+        params = []
+        for device_id, register_number, register_id, value, timestamp in newest.values():
+            params += [device_id, register_number, register_id, value, timestamp, self.env.uid, self.env.uid, now, now]
+        placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s, %s)'] * len(newest))
+        self.env.cr.execute(f"""
+            INSERT INTO modbus_data_latest AS l
+                (device_id, register_number, register_id, value, "timestamp",
+                 create_uid, write_uid, create_date, write_date)
+            VALUES {placeholders}
+            ON CONFLICT (device_id, register_number, COALESCE(register_id, 0)) DO UPDATE SET
+                value = EXCLUDED.value,
+                "timestamp" = EXCLUDED."timestamp",
+                write_date = EXCLUDED.write_date
+            WHERE EXCLUDED."timestamp" >= l."timestamp"
+        """, params)
+        self.invalidate_model()
+
+    @api.model
+    def _refresh(self, keys):
+        """Recompute the latest values of ``(device_id, register_number, register_id)`` keys from modbus.data.
+
+        Used after rows were deleted, one of which may have been the latest.
+        """
+        if not keys:
+            return
+        device_ids, register_numbers, tag_ids = zip(*[(d, r, t or 0) for d, r, t in keys])
+        params = {
+            'device_ids': list(device_ids),
+            'register_numbers': list(register_numbers),
+            'tag_ids': list(tag_ids),
+            'uid': self.env.uid,
+        }
+        keys_table = """
+            (SELECT * FROM unnest(%(device_ids)s::int[], %(register_numbers)s::int[], %(tag_ids)s::int[])
+                 AS k(device_id, register_number, tag_id))
+        """
+        self.env.cr.execute(f"""
+            DELETE FROM modbus_data_latest l
+             USING {keys_table} k
+             WHERE l.device_id = k.device_id AND l.register_number = k.register_number
+               AND COALESCE(l.register_id, 0) = k.tag_id
+        """, params)
+        self.env.cr.execute(f"""
+            INSERT INTO modbus_data_latest
+                (device_id, register_number, register_id, value, "timestamp",
+                 create_uid, write_uid, create_date, write_date)
+            SELECT DISTINCT ON (d.device_id, d.register_number, COALESCE(d.register_id, 0))
+                   d.device_id, d.register_number, d.register_id, d.value, d."timestamp",
+                   %(uid)s, %(uid)s, now() AT TIME ZONE 'UTC', now() AT TIME ZONE 'UTC'
+              FROM modbus_data d
+              JOIN {keys_table} k
+                ON d.device_id = k.device_id AND d.register_number = k.register_number
+               AND COALESCE(d.register_id, 0) = k.tag_id
+          ORDER BY d.device_id, d.register_number, COALESCE(d.register_id, 0), d."timestamp" DESC, d.id DESC
+        """, params)
+        self.invalidate_model()
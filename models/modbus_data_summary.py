@@ -0,0 +1,240 @@
+import logging
+from collections import Counter
+from datetime import timedelta
+
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+# Rollup chain: tier -> (source tier, date_trunc unit); 'raw' is modbus.data
+TIERS = {
+    'minute': ('raw', 'minute'),
+    'hour': ('minute', 'hour'),
+    'day': ('hour', 'day'),
+}
+# Width of the buckets of each tier, in seconds
+TIER_SECONDS = {'minute': 60, 'hour': 3600, 'day': 86400}
+# Default retention in days per tier, 0 keeps the data forever. Overridden by
+# the ir.config_parameter modbus_connector.retention_<tier>_days
+DEFAULT_RETENTION_DAYS = {'raw': 30, 'minute': 90, 'hour': 730, 'day': 0}
+# Longest time span each tier is used for when reading history
+TIER_MAX_SPAN = [
+    ('raw', timedelta(hours=6)),
+    ('minute', timedelta(days=7)),
+    ('hour', timedelta(days=180)),
+    ('day', None),
+]
+DELETE_CHUNK_SIZE = 10000
+
+BUCKET_KEY = "tier, device_id, register_number, COALESCE(register_id, 0), bucket_start"
+
+
+class ModbusDataSummary(models.Model):
+    _name = 'modbus.data.summary'
+    _description = 'Modbus Historical Data Summary'
+    _order = 'bucket_start desc'
+
+    tier = fields.Selection([
+        ('minute', '1 Minute'),
+        ('hour', '1 Hour'),
+        ('day', '1 Day')
+    ], string='Tier', required=True, readonly=True)
+    bucket_start = fields.Datetime(string='Bucket Start', required=True, readonly=True)
+    device_id = fields.Many2one('modbus.device', string='Device', required=True, ondelete='cascade', readonly=True)
+    register_number = fields.Integer(string='Register Number', required=True, readonly=True)
+    register_id = fields.Many2one('modbus.register', string='Tag', ondelete='set null', readonly=True)
+    value_min = fields.Float(string='Min', readonly=True, aggregator='min')
+    value_max = fields.Float(string='Max', readonly=True, aggregator='max')
+    value_avg = fields.Float(string='Average', readonly=True, aggregator='avg')
+    sample_count = fields.Integer(string='Samples', readonly=True)
+
+    def init(self):
+        # Target of the ON CONFLICT clauses of the rollup
+        self.env.cr.execute(f"""
+            CREATE UNIQUE INDEX IF NOT EXISTS modbus_data_summary_bucket_uniq
+            ON modbus_data_summary ({BUCKET_KEY})
+        """)
+        # Trends of a device over a time span, and retention per tier
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS modbus_data_summary_device_tier_bucket_idx
+            ON modbus_data_summary (device_id, tier, bucket_start DESC)
+        """)
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS modbus_data_summary_tier_bucket_idx
+            ON modbus_data_summary (tier, bucket_start)
+        """)
+        # Changed source buckets looked up by the hour and day rollups
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS modbus_data_summary_tier_write_date_idx
+            ON modbus_data_summary (tier, write_date)
+        """)
+
+    @api.model
+    def _get_param(self, key, default):
+        return self.env['ir.config_parameter'].sudo().get_param(f'modbus_connector.{key}', default)
+
+    @api.model
+    def _set_param(self, key, value):
+        self.env['ir.config_parameter'].sudo().set_param(f'modbus_connector.{key}', value)
+
+    @api.model
+    def _select_tier(self, date_from, date_to=None):
+        """Return the tier ('raw' or a summary tier) that fits a time span.
+
+        Spans older than the retention of a tier fall back to a coarser one.
+        """
+        date_to = date_to or fields.Datetime.now()
+        span = date_to - date_from
+        for tier, max_span in TIER_MAX_SPAN:
+            days = int(self._get_param(f'retention_{tier}_days', DEFAULT_RETENTION_DAYS[tier]))
+            if days and date_from < fields.Datetime.now() - timedelta(days=days):
+                continue
+            if max_span is None or span <= max_span:
+                return tier
+        return 'day'
+
+    @api.model
+    def _cron_rollup(self):
+        """Aggregate new samples into the summary tiers, then apply retention."""
+        if self.env['modbus.data']._is_partitioned():
+            self.env['modbus.data']._ensure_partitions()
+        self._rollup_raw()
+        for tier in ('hour', 'day'):
+            self._rollup_tier(tier)
+        self._apply_retention()
+
+    @api.model
+    def _rollup_raw(self):
+        """Fold the modbus.data rows inserted since the previous run into the minute tier.
+
+        Rows are tracked by id rather than timestamp so late rows (e.g. values
+        buffered by the bridge) are still counted. Only ids seen by the
+        previous run are processed, which leaves transactions that were still
+        open at that time a full cron period to commit.
+        """
+        cr = self.env.cr
+        last_id = int(self._get_param('rollup_raw_last_id', 0))
+        until_id = int(self._get_param('rollup_raw_seen_id', 0))
+        cr.execute("SELECT COALESCE(MAX(id), 0) FROM modbus_data")
+        seen_id = cr.fetchone()[0]
+        if until_id > last_id:
+            cr.execute(f"""
+                INSERT INTO modbus_data_summary AS s
+                    (tier, bucket_start, device_id, register_number, register_id,
+                     value_min, value_max, value_avg, sample_count,
+                     create_uid, write_uid, create_date, write_date)
+                SELECT 'minute', date_trunc('minute', timestamp), device_id, register_number, register_id,
+                       MIN(value), MAX(value), AVG(value), COUNT(*),
+                       %(uid)s, %(uid)s, now() AT TIME ZONE 'UTC', now() AT TIME ZONE 'UTC'
+                  FROM modbus_data
+                 WHERE id > %(last_id)s AND id <= %(until_id)s AND value IS NOT NULL
+              GROUP BY date_trunc('minute', timestamp), device_id, register_number, register_id
+            ON CONFLICT ({BUCKET_KEY}) DO UPDATE SET
+                value_min = LEAST(s.value_min, EXCLUDED.value_min),
+                value_max = GREATEST(s.value_max, EXCLUDED.value_max),
+                value_avg = (s.value_avg * s.sample_count + EXCLUDED.value_avg * EXCLUDED.sample_count)
+                            / (s.sample_count + EXCLUDED.sample_count),
+                sample_count = s.sample_count + EXCLUDED.sample_count,
+                write_date = EXCLUDED.write_date
+            """, {'uid': self.env.uid, 'last_id': last_id, 'until_id': until_id})
+            _logger.info("Rolled up modbus.data ids %s-%s into %s minute buckets", last_id + 1, until_id, cr.rowcount)
+            self._set_param('rollup_raw_last_id', until_id)
+        self._set_param('rollup_raw_seen_id', seen_id)
+
+    @api.model
+    def _rollup_tier(self, tier):
+        """Recompute the buckets of ``tier`` whose source buckets changed since the last run."""
+        source_tier, unit = TIERS[tier]
+        cr = self.env.cr
+        cr.execute("SELECT now() AT TIME ZONE 'UTC'")
+        until = cr.fetchone()[0]
+        since = self._get_param(f'rollup_{tier}_since', '1970-01-01 00:00:00')
+        cr.execute(f"""
+            INSERT INTO modbus_data_summary AS s
+                (tier, bucket_start, device_id, register_number, register_id,
+                 value_min, value_max, value_avg, sample_count,
+                 create_uid, write_uid, create_date, write_date)
+            SELECT %(tier)s, date_trunc(%(unit)s, src.bucket_start), src.device_id, src.register_number, src.register_id,
+                   MIN(src.value_min), MAX(src.value_max),
+                   SUM(src.value_avg * src.sample_count) / SUM(src.sample_count), SUM(src.sample_count),
+                   %(uid)s, %(uid)s, %(until)s, %(until)s
+              FROM modbus_data_summary src
+              JOIN (SELECT DISTINCT device_id, register_number, COALESCE(register_id, 0) AS tag,
+                           date_trunc(%(unit)s, bucket_start) AS bucket
+                      FROM modbus_data_summary
+                     WHERE tier = %(source_tier)s AND write_date > %(since)s AND write_date <= %(until)s
+                   ) changed
+                ON changed.device_id = src.device_id
+               AND changed.register_number = src.register_number
+               AND changed.tag = COALESCE(src.register_id, 0)
+               AND changed.bucket = date_trunc(%(unit)s, src.bucket_start)
+             WHERE src.tier = %(source_tier)s
+          GROUP BY date_trunc(%(unit)s, src.bucket_start), src.device_id, src.register_number, src.register_id
+        ON CONFLICT ({BUCKET_KEY}) DO UPDATE SET
+            value_min = EXCLUDED.value_min,
+            value_max = EXCLUDED.value_max,
+            value_avg = EXCLUDED.value_avg,
+            sample_count = EXCLUDED.sample_count,
+            write_date = EXCLUDED.write_date
+        """, {
+            'tier': tier, 'source_tier': source_tier, 'unit': unit,
+            'since': since, 'until': until, 'uid': self.env.uid,
+        })
+        _logger.info("Recomputed %s %s buckets of Modbus data", cr.rowcount, tier)
+        self._set_param(f'rollup_{tier}_since', fields.Datetime.to_string(until))
+
+    @api.model
+    def _apply_retention(self):
+        """Delete the rows older than the retention of each tier, in committed chunks."""
+        now = fields.Datetime.now()
+        for tier, default in DEFAULT_RETENTION_DAYS.items():
+            days = int(self._get_param(f'retention_{tier}_days', default))
+            if not days:
+                continue
+            cutoff = now - timedelta(days=days)
+            if tier == 'raw':
+                # Never drop rows that were not rolled up yet
+                last_id = int(self._get_param('rollup_raw_last_id', 0))
+                deleted = 0
+                if self.env['modbus.data']._is_partitioned():
+                    # Whole expired months go away with a partition drop
+                    dropped = self.env['modbus.data']._drop_expired_partitions(cutoff, last_id)
+                    self._discount_deleted_rows(dropped)
+                    self.env.cr.commit()
+                    deleted = sum(dropped.values())
+                deleted += self._delete_in_chunks(
+                    'modbus_data', '"timestamp" < %s AND id <= %s', (cutoff, last_id))
+            else:
+                deleted = self._delete_in_chunks(
+                    'modbus_data_summary', "tier = %s AND bucket_start < %s", (tier, cutoff))
+            if deleted:
+                _logger.info("Deleted %s %s Modbus data rows older than %s", deleted, tier, cutoff)
+
+    @api.model
+    def _delete_in_chunks(self, table, where, params):
+        cr = self.env.cr
+        deleted = 0
+        while True:
+            cr.execute(f"""
+                DELETE FROM {table} WHERE id IN (
+                    SELECT id FROM {table} WHERE {where} LIMIT %s
+                )
+                RETURNING device_id
+            """, (*params, DELETE_CHUNK_SIZE))
+            device_ids = [device_id for (device_id,) in cr.fetchall()]
+            chunk = len(device_ids)
+            deleted += chunk
+            if table == 'modbus_data':
+                # Keep the device counters in the same transaction as the delete
+                self._discount_deleted_rows(Counter(device_ids))
+            # Commit every chunk to keep the transactions and locks short
+            cr.commit()
+            if chunk < DELETE_CHUNK_SIZE:
+                break
+        return deleted
+
+    @api.model
+    def _discount_deleted_rows(self, deleted):
+        """Subtract ``{device_id: rows}`` deleted from modbus_data from the device counters."""
+        self.env['modbus.device']._add_data_counts(
+            {device_id: (-count, None) for device_id, count in deleted.items()})
@@ -1,13 +1,22 @@
 from odoo import models, fields, api
+from odoo.exceptions import ValidationError
 import requests
-from datetime import datetime
 import logging
-import threading
 import time
-import odoo
+from collections import defaultdict
+from datetime import timedelta
+from odoo.tools import config
+
+from ..services import adaptive_polling as adaptive, bridge_client, bulk_actions, diagnostics as diag, metrics
+from ..services.historian import StoragePolicy, forget_device
+from ..services.register_map import decode_blocks, plan_reads
+from ..services.poll_scheduler import MIN_POLLING_INTERVAL_MS, get_scheduler
 
 _logger = logging.getLogger(__name__)
 
+# Deadline (seconds) of each bridge request of the bulk test / fetch actions
+BULK_ACTION_TIMEOUT = 10
+
 class ModbusDevice(models.Model):
     _name = 'modbus.device'
     _description = 'Modbus Device'
@@ -21,6 +30,20 @@ class ModbusDevice(models.Model):
     number_of_registers = fields.Integer(string='Number of Registers', required=True, default=1)
     api_port = fields.Integer(string='API Port', required=True, default=3001)
     is_polling = fields.Boolean(string='Is Polling', default=False, readonly=True)
+    acquisition_mode = fields.Selection([
+        ('poll', 'Request Polling'),
+        ('stream', 'Bridge Streaming')
+    ], string='Acquisition Mode', required=True, default='poll',
+        help="Request Polling: Odoo asks the bridge for the values at every interval.\n"
+             "Bridge Streaming: the bridge polls the PLC itself and only pushes changed values to Odoo.")
+    adaptive_polling = fields.Boolean(string='Adaptive Polling',
+        help="Poll faster while the values change and slower while they stay the same or the device fails, "
+             "between the minimum and maximum intervals, starting from the polling interval. "
+             "Only applies to Request Polling.")
+    min_polling_interval = fields.Integer(string='Min Polling Interval (ms)', default=250)
+    max_polling_interval = fields.Integer(string='Max Polling Interval (ms)', default=10000)
+    current_polling_interval = fields.Integer(string='Current Polling Interval (ms)', readonly=True,
+        help="Interval the scheduler currently polls this adaptive device at")
     
     api_url = fields.Char(string='API URL', compute='_compute_api_url', store=True)
     status = fields.Selection([
@@ -31,37 +54,122 @@ class ModbusDevice(models.Model):
     ], string='Status', default='disconnected', readonly=True)
     last_values = fields.Text(string='Last Values', readonly=True)
     last_error = fields.Text(string='Last Error', readonly=True)
+    register_ids = fields.One2many('modbus.register', 'device_id', string='Register Map')
+    max_in_flight = fields.Integer(string='Max Requests In Flight', default=1,
+        help="Requests the bridge may keep outstanding on the connection to this PLC or gateway. "
+             "Raise it only for devices that handle pipelined Modbus TCP transactions.")
+    max_read_gap = fields.Integer(string='Max Read Gap', default=10,
+        help="Register map tags whose addresses are at most this far apart are fetched with one read. "
+             "Set to 0 for devices that reject reads of undefined addresses.")
+    storage_policy = fields.Selection([
+        ('all', 'Every Sample'),
+        ('change', 'On Change'),
+        ('deadband_abs', 'Absolute Deadband'),
+        ('deadband_pct', 'Percent Deadband')
+    ], string='Storage Policy', required=True, default='all',
+        help="Which polled values are written to the historical data. Tags can override it.")
+    deadband = fields.Float(string='Deadband',
+        help="Smallest change that is stored: in register units for the absolute deadband, in % of the last stored value for the percent deadband")
+    heartbeat_interval = fields.Integer(string='Heartbeat Interval (s)', default=0,
+        help="Store a value at least this often even when it did not change. 0 disables the heartbeat.")
     data_ids = fields.One2many('modbus.data', 'device_id', string='Historical Data')
-    data_count = fields.Integer(compute='_compute_data_count', string='Data Count')
+    # Maintained incrementally by modbus.data create/unlink and the retention, see _add_data_counts
+    data_count = fields.Integer(string='Data Count', readonly=True, default=0)
+    last_sample_at = fields.Datetime(string='Last Sample', readonly=True)
+    latest_value_ids = fields.One2many('modbus.data.latest', 'device_id', string='Latest Values')
+    poll_stats_ids = fields.One2many('modbus.poll.stats', 'device_id', string='Poll Timings')
+    diagnostics = fields.Boolean(string='Diagnostics Mode',
+        help="Log every poll of this device with the full bridge response. Leave off in production: "
+             "otherwise only one poll out of modbus_trace_every is traced, at DEBUG level.")
+
+    @api.constrains('adaptive_polling', 'min_polling_interval', 'max_polling_interval')
+    def _check_adaptive_intervals(self):
+        for record in self.filtered('adaptive_polling'):
+            if record.min_polling_interval < MIN_POLLING_INTERVAL_MS:
+                raise ValidationError(
+                    f"Device {record.name}: the minimum polling interval must be at least {MIN_POLLING_INTERVAL_MS} ms")
+            if record.max_polling_interval < record.min_polling_interval:
+                raise ValidationError(
+                    f"Device {record.name}: the maximum polling interval must not be below the minimum one")
+
+    def _register_hook(self):
+        super()._register_hook()
+        # Resume polling of the devices left with is_polling set, e.g. after a restart
+        if not config['test_enable']:
+            get_scheduler(self.env.cr.dbname).start()
 
     @api.depends('api_port')
     def _compute_api_url(self):
         for record in self:
             record.api_url = f'http://host.docker.internal:{record.api_port}'
 
-    @api.depends('data_ids')
-    def _compute_data_count(self):
+    @api.model
+    def _add_data_counts(self, counts):
+        """Add rows to the stored data counters of the devices.
+
+        ``counts`` is a ``{device_id: (number of rows, newest timestamp)}``
+        dict; the number is negative for deleted rows and the timestamp may be
+        None. A single UPDATE adjusts every device in place, so concurrent
+        ingestions never overwrite each other's counts.
+        """
+        if not counts:
+            return
+        params = [param for device_id, (count, timestamp) in counts.items() for param in (device_id, count, timestamp)]
+        placeholders = ', '.join(['(%s, %s, %s::timestamp)'] * len(counts))
+        self.env.cr.execute(f"""
+            UPDATE modbus_device AS d
+               SET data_count = GREATEST(COALESCE(d.data_count, 0) + v.added, 0),
+                   last_sample_at = GREATEST(d.last_sample_at, v.last_timestamp)
+              FROM (VALUES {placeholders}) AS v(id, added, last_timestamp)
+             WHERE d.id = v.id
+        """, params)
+        self.browse(list(counts)).invalidate_recordset(['data_count', 'last_sample_at'])
+
+    def _refresh_last_sample(self):
+        """Recompute the newest sample time of the devices, e.g. after rows were deleted."""
+        if not self:
+            return
+        self.env.cr.execute("""
+            UPDATE modbus_device d
+               SET last_sample_at = (SELECT MAX("timestamp") FROM modbus_data WHERE device_id = d.id)
+             WHERE d.id IN %s
+        """, (tuple(self.ids),))
+        self.invalidate_recordset(['last_sample_at'])
+
+    def _recount_data(self):
+        """Recompute the data counters and latest values of the devices from modbus.data."""
+        if not self:
+            return
+        self.env['modbus.data'].flush_model()
+        groups = self.env['modbus.data']._read_group(
+            [('device_id', 'in', self.ids)], ['device_id'], ['__count', 'timestamp:max'])
+        stats = {device.id: (count, last_timestamp) for device, count, last_timestamp in groups}
         for record in self:
-            record.data_count = len(record.data_ids)
+            count, last_timestamp = stats.get(record.id, (0, False))
+            record.write({'data_count': count, 'last_sample_at': last_timestamp})
+
+        self.env.cr.execute("DELETE FROM modbus_data_latest WHERE device_id IN %s", (tuple(self.ids),))
+        # Newest row of each register, read backwards along the device/register/timestamp index
+        self.env.cr.execute("""
+            INSERT INTO modbus_data_latest
+                (device_id, register_number, register_id, value, "timestamp",
+                 create_uid, write_uid, create_date, write_date)
+            SELECT DISTINCT ON (device_id, register_number, COALESCE(register_id, 0))
+                   device_id, register_number, register_id, value, "timestamp",
+                   %(uid)s, %(uid)s, now() AT TIME ZONE 'UTC', now() AT TIME ZONE 'UTC'
+              FROM modbus_data
+             WHERE device_id IN %(ids)s
+          ORDER BY device_id, register_number, COALESCE(register_id, 0), "timestamp" DESC, id DESC
+        """, {'uid': self.env.uid, 'ids': tuple(self.ids)})
+        self.env['modbus.data.latest'].invalidate_model()
 
     def test_connection(self):
         self.ensure_one()
         try:
-            _logger.info(f"Testing connection for device {self.name} at {self.api_url}/data")
-            # Send device configuration in the request body
-            config_data = {
-                'ip': self.plc_ip,
-                'port': self.plc_port,
-                'slaveId': self.slave_id,
-                'startingRegister': self.starting_register,
-                'numberOfRegisters': self.number_of_registers
-            }
-            
-            # Use the /data endpoint with POST method
-            response = requests.post(f"{self.api_url}/data", json=config_data, timeout=10) # Increased timeout for connection test
-            response.raise_for_status()
-            data = response.json()
-            
+            _logger.info("Testing connection for device %s at %s/data", self.name, self.api_url)
+            # Send device configuration in the request body, over the pooled keep-alive session
+            data = bridge_client.read_device(self.api_url, self._get_read_config(), timeout=10) # Increased timeout for connection test
+
             # Update device status based on the response from the API
             self.status = data.get('connectionStatus', 'error')
             
@@ -131,117 +239,33 @@ class ModbusDevice(models.Model):
 
     def fetch_data(self):
 
-        start_time = time.time() #for measuring the time it takes to fetch data
+        start_time = time.perf_counter() #for measuring the time it takes to fetch data
 
         self.ensure_one()
+        db_name = self.env.cr.dbname
         try:
-            _logger.info(f"Fetching data from device {self.name} at {self.api_url}/data")
-            
-            # Send device configuration in the request body
-            config_data = {
-                'ip': self.plc_ip,
-                'port': self.plc_port,
-                'slaveId': self.slave_id,
-                'startingRegister': self.starting_register,
-                'numberOfRegisters': self.number_of_registers
-            }
-            
-            # Use the /data endpoint with POST method
-            response = requests.post(f"{self.api_url}/data", json=config_data, timeout=10) # Increased timeout
-            response.raise_for_status()
-            data = response.json()
-            
-            # Debug logging
-            _logger.info(f"Received data from API for device {self.name}: {data}")
-            
-            # Update device status based on API response
-            self.status = data.get('connectionStatus', 'error')
-            
-            # Get values array from the response
-            values = data.get('values', [])
-            if not isinstance(values, list):
-                values = []
-            
-            # Debug logging
-            _logger.info(f"Extracted values for device {self.name}: {values}")
-            
-            # Convert values to strings and handle None/0 values
-            formatted_values = []
-            # Use the actual starting register from the device config
-            for i, value in enumerate(values):
-                register_num = self.starting_register + i
-                formatted_values.append(f"Register {register_num}: {value}")
-                # Debug: print all device monitors
-                all_monitors = self.env['device.monitor'].search([])
-                print(f"!!! All device monitors: {[(m.id, m.device_id, m.device_id._name if m.device_id else None, m.active) for m in all_monitors]}")
-                print(f"!!! Searching for device monitors with device_id={self.id} and active=True")
-                reference = f"modbus.device,{self.id}"
-                monitors = self.env['device.monitor'].search([('device_id', '=', reference), ('active', '=', True)])
-                print(f"!!! Found monitors: {monitors}")
-                for monitor in monitors:
-                    print(f"!!! DeviceMonitor _process_plc_data called: register={register_num}, value={value}")
-                    monitor._process_plc_data(str(register_num), value)
-            # Debug logging
-            _logger.info(f"Formatted values for device {self.name}: {formatted_values}")
-            
-            
-            # Update the last_values field
-            self.last_values = '\n'.join(formatted_values) if formatted_values else 'No data received'
-            self.last_error = data.get('error')
+            _logger.info("Fetching data from device %s at %s/data", self.name, self.api_url)
 
-            # Determine status and message based on API response
-            message = ''
-            message_type = 'info'
+            # Send device configuration in the request body, over the pooled keep-alive session
+            read_config = self._get_read_config()
+            if self.is_polling:
+                # The poller reads this device anyway: accept its last values
+                # rather than asking the PLC once more
+                read_config['maxAgeMs'] = self.polling_interval
+            with metrics.timed(db_name, self.ids, 'bridge_http'):
+                data = bridge_client.read_device(self.api_url, read_config, timeout=10) # Increased timeout
+            self._record_bridge_timings(data)
 
-            if data.get('error'):
-                message = f'Error fetching data for device {self.name}: {data.get("error")}'
-                message_type = 'danger'
-            elif not values:
-                 message = f'No data received from device {self.name}'
-                 message_type = 'warning'
-            else:
-                message = f'Data fetched successfully for device {self.name}:\n' + '\n'.join(formatted_values)
-                message_type = 'success'
-            
-            # If polling, keep status as 'polling', else set to 'connected' (if no error)
-            if self.is_polling and self.status != 'error': # Added check for error status
-                 self.status = 'polling'
-            elif self.status != 'error':
-                 self.status = 'connected'
-
-            # Create historical data records for each value
-            # Only create records if values were successfully read and no major error
-            if values and not data.get('error'): # Added check for values and error
-                for i, value in enumerate(values):
-                    self.env['modbus.data'].create({
-                        'device_id': self.id,
-                        'timestamp': datetime.now(),
-                        'register_number': self.starting_register + i, # Use device's starting register
-                        'value': value,
-                        'error': data.get('error') # Record error if any for this fetch
-                    })
+            with metrics.timed(db_name, self.ids, 'decode'):
+                poll_result, message, message_type = self._apply_poll_response(data)
+            # A cached answer is a value the poller read and stored already
+            if poll_result and not data.get('cached'):
+                self._store_poll_results([poll_result])
                 # Calculate and log latency
-                end_time = time.time()
-                fetch_time = end_time - start_time
-                latency = fetch_time * 1000 #convert to milliseconds
-                _logger.info(f"Time taken to fetch data for device {self.name}: {fetch_time} seconds, latency: {latency} ms")
-
-            # Show appropriate message based on status
-            # This part is redundant as message and message_type are already determined above
-            # if data.get('error'):
-            #     message = f'Error: {data.get("error")}'
-            #     message_type = 'danger'
-            # else:
-            #     if not values:
-            #         message = 'No data received from device'
-            #         message_type = 'warning'
-            #     else:
-            #         message = 'Data fetched successfully:\n' + '\n'.join(formatted_values)
-            #         message_type = 'success'
-            
-            # Debug logging
-            _logger.info(f"Final message for device {self.name}: {message}")
-            
+                fetch_time = time.perf_counter() - start_time
+                metrics.record(db_name, self.ids, 'cycle', fetch_time)
+                _logger.info("Time taken to fetch data for device %s: %.1f ms", self.name, fetch_time * 1000)
+
             # Only show notification if there is an error or if it's not polling (to avoid spamming notifications)
             if data.get('error') or not self.is_polling:
                 return {
@@ -288,21 +312,419 @@ class ModbusDevice(models.Model):
                 }
             }
 
+    def action_test_connections(self):
+        """Test the connection of the selected devices in the background."""
+        return self._start_bulk_action('test')
+
+    def action_fetch_data_bulk(self):
+        """Fetch the data of the selected devices in the background."""
+        return self._start_bulk_action('fetch')
+
+    def _start_bulk_action(self, action):
+        """Read the devices concurrently once this transaction commits and return right away.
+
+        The HTTP worker is not held while the bridge answers; every result is
+        pushed to the user over the bus as it arrives, then a summary.
+        """
+        jobs = {}
+        for device in self:
+            config = device._get_read_config()
+            if action == 'fetch' and device.is_polling:
+                config['maxAgeMs'] = device.polling_interval
+            jobs[device.id] = (device.api_url, config)
+        db_name, uid = self.env.cr.dbname, self.env.uid
+        self.env.cr.postcommit.add(
+            lambda: bulk_actions.start(db_name, uid, action, jobs, BULK_ACTION_TIMEOUT))
+        title = 'Connection Test' if action == 'test' else 'Fetch Data'
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': title,
+                'message': f'{title} of {len(self)} devices started, the results will be notified as they arrive.',
+                'type': 'info',
+                'sticky': False,
+            }
+        }
+
+    def _apply_bulk_result(self, action, data, error):
+        """Update the device from the read made by a bulk action and notify the user.
+
+        ``error`` is the exception of a failed bridge request, else ``data``
+        holds the bridge response. Returns whether the device answered.
+        """
+        self.ensure_one()
+        if error is not None:
+            if isinstance(error, requests.exceptions.ConnectionError):
+                message = f"Could not connect to Modbus API at {self.api_url}. Please ensure the API server is running and accessible."
+            else:
+                message = f"Error reading device {self.name}: {error}"
+            self.write({'status': 'error', 'last_error': message})
+            ok = False
+        elif action == 'test':
+            ok = not data.get('error')
+            if ok:
+                message = f"Successfully connected to Modbus device {self.name} at {self.plc_ip}:{self.plc_port}"
+                self.write({'status': 'polling' if self.is_polling else 'connected', 'last_error': False})
+            else:
+                message = f"Connection test failed: {data.get('error')}"
+                self.write({'status': data.get('connectionStatus', 'error'), 'last_error': message})
+        else:
+            self._record_bridge_timings(data)
+            poll_result, message, message_type = self._apply_poll_response(data)
+            if poll_result and not data.get('cached'):
+                self._store_poll_results([poll_result])
+            ok = message_type == 'success'
+        self.env['bus.bus']._sendone(self.env.user.partner_id, 'modbus_connector/device_result', {
+            'device_id': self.id,
+            'action': action,
+            'ok': ok,
+            'status': self.status,
+            'message': message,
+        })
+        return ok
+
+    @api.model
+    def _notify_bulk_done(self, action, outcomes):
+        """Send the summary of a bulk action, ``outcomes`` mapping device ids to success."""
+        failed = self.browse([device_id for device_id, ok in outcomes.items() if not ok]).exists()
+        title = 'Connection Test' if action == 'test' else 'Fetch Data'
+        message = f"{len(outcomes) - len(failed)} of {len(outcomes)} devices answered."
+        if failed:
+            message += " Failed: " + ', '.join(failed.mapped('name'))
+        self.env['bus.bus']._sendone(self.env.user.partner_id, 'simple_notification', {
+            'title': title,
+            'message': message,
+            'type': 'warning' if failed else 'success',
+            'sticky': bool(failed),
+        })
+
+    def _get_trace_level(self):
+        """Return the level to log the details of this poll of the device at, or None.
+
+        Devices in diagnostics mode are traced at every poll; the others one
+        poll out of ``modbus_trace_every`` (Odoo configuration option), and
+        only when DEBUG is enabled, so steady polling formats no messages.
+        """
+        self.ensure_one()
+        if self.diagnostics:
+            return logging.INFO
+        if _logger.isEnabledFor(logging.DEBUG):
+            every = int(config.get('modbus_trace_every') or diag.DEFAULT_TRACE_EVERY)
+            if diag.sample(self.env.cr.dbname, self.id, every):
+                return logging.DEBUG
+        return None
+
+    def _record_bridge_timings(self, data):
+        """Record the PLC read time the bridge reports in the ``timings`` of a read response."""
+        self.ensure_one()
+        timings = data.get('timings')
+        # Answers served from the bridge cache did not read the PLC
+        if isinstance(timings, dict) and not data.get('cached'):
+            plc_ms = (timings.get('connectMs') or 0) + (timings.get('readMs') or 0)
+            metrics.record(self.env.cr.dbname, self.ids, 'plc_read', plc_ms / 1000.0)
+
+    def _get_storage_policy(self):
+        """Return the ``StoragePolicy`` applied to the raw registers of the device."""
+        self.ensure_one()
+        return StoragePolicy(self.storage_policy, self.deadband, self.heartbeat_interval)
+
+    def _get_read_config(self):
+        """Return the device configuration the bridge expects in a read request."""
+        self.ensure_one()
+        config = {
+            'ip': self.plc_ip,
+            'port': self.plc_port,
+            'slaveId': self.slave_id,
+            'startingRegister': self.starting_register,
+            'numberOfRegisters': self.number_of_registers,
+            'maxInFlight': max(self.max_in_flight, 1),
+        }
+        if self.register_ids:
+            # With a register map only the planned blocks are read, not the register window
+            codecs = self.register_ids._get_codecs()
+            blocks = plan_reads([(codec.function_code, codec.address, codec.words) for codec in codecs], self.max_read_gap)
+            config['reads'] = [
+                {'functionCode': function_code, 'address': address, 'count': count}
+                for function_code, address, count in blocks
+            ]
+            config['maxReadGap'] = self.max_read_gap
+        return config
+
+    def _get_stream_config(self):
+        """Return the subscription the bridge polls locally in streaming mode."""
+        self.ensure_one()
+        return dict(self._get_read_config(), id=self.id, intervalMs=self.polling_interval)
+
+    def _apply_poll_response(self, data):
+        """Update the device from one bridge read response.
+
+        Returns ``(poll_result, message, message_type)`` where ``poll_result`` is
+        the entry to pass to ``_store_poll_results`` (None when nothing was read).
+        """
+        self.ensure_one()
+        trace_level = self._get_trace_level()
+        if trace_level:
+            _logger.log(trace_level, "Received data from API for device %s: %s", self.name, data)
+        # Update device status based on API response
+        self.status = data.get('connectionStatus', 'error')
+
+        # Get values array from the response
+        values = data.get('values', [])
+        if not isinstance(values, list):
+            values = []
+        # Use the actual starting register from the device config
+        values = {self.starting_register + i: value for i, value in enumerate(values)}
+
+        # Register map devices get their blocks decoded into tag values
+        tag_values = {}
+        if isinstance(data.get('blocks'), list) and self.register_ids:
+            tag_values = self._decode_blocks(data['blocks'])
+
+        if trace_level:
+            _logger.log(trace_level, "Extracted values for device %s: %s", self.name, values or tag_values)
+
+        formatted_values = self._format_values(values, tag_values)
+
+        # Update the last_values field
+        self.last_values = '\n'.join(formatted_values) if formatted_values else 'No data received'
+        self.last_error = data.get('error')
+
+        # Determine status and message based on API response
+        if data.get('error'):
+            message = f'Error fetching data for device {self.name}: {data.get("error")}'
+            message_type = 'danger'
+        elif not values and not tag_values:
+            message = f'No data received from device {self.name}'
+            message_type = 'warning'
+        else:
+            message = f'Data fetched successfully for device {self.name}:\n' + '\n'.join(formatted_values)
+            message_type = 'success'
+
+        # If polling, keep status as 'polling', else set to 'connected' (if no error)
+        if self.is_polling and self.status != 'error': # Added check for error status
+            self.status = 'polling'
+        elif self.status != 'error':
+            self.status = 'connected'
+
+        # Only store values if they were successfully read and no major error
+        poll_result = None
+        if (values or tag_values) and not data.get('error'):
+            poll_result = {
+                'device_id': self.id,
+                'values': values,
+                'tag_values': tag_values,
+            }
+        return poll_result, message, message_type
+
+    def _decode_blocks(self, blocks):
+        """Decode the register map tags from the ``blocks`` of a bridge response."""
+        self.ensure_one()
+        return decode_blocks(
+            [(block['functionCode'], block['address'], block['values']) for block in blocks],
+            self.register_ids._get_codecs(),
+        )
+
+    def _format_values(self, values, tag_values=None):
+        """Return the lines shown in last_values for raw register and tag values."""
+        self.ensure_one()
+        lines = [f"Register {register_num}: {value}" for register_num, value in sorted(values.items())]
+        if tag_values:
+            lines += [f"{tag.name}: {tag_values[tag.id]}" for tag in self.register_ids if tag.id in tag_values]
+        return lines
+
+    @api.model
+    def _store_poll_results(self, poll_results):
+        """Write the poll results of one or more devices and hand them to the monitors."""
+        db_name = self.env.cr.dbname
+        device_ids = [result['device_id'] for result in poll_results]
+        with metrics.timed(db_name, device_ids, 'db_write'):
+            self.env['modbus.data']._ingest_poll_results(poll_results)
+        # Monitors are resolved once per poll and get the whole batch, tags by name
+        tag_names = {tag.id: tag.name for tag in self.env['modbus.register'].browse(
+            [tag_id for result in poll_results for tag_id in result.get('tag_values', {})])}
+        values_by_device = {}
+        for result in poll_results:
+            register_values = values_by_device.setdefault(result['device_id'], {})
+            register_values.update((str(register_num), value) for register_num, value in result['values'].items())
+            register_values.update((tag_names[tag_id], value) for tag_id, value in result.get('tag_values', {}).items())
+        with metrics.timed(db_name, device_ids, 'dispatch'):
+            self._dispatch_to_monitors(values_by_device)
+
+    def _poll_devices(self):
+        """Read these devices with one batch request per bridge and store all results together.
+
+        Used by the polling scheduler, so a poll cycle of N devices behind one
+        bridge costs one HTTP round trip instead of N. Returns the outcome of
+        each poll (``adaptive_polling.CHANGED``, ``STATIC`` or ``ERROR``) by
+        device id, which drives the rate of adaptive devices.
+        """
+        devices_by_bridge = defaultdict(lambda: self.browse())
+        for device in self:
+            devices_by_bridge[device.api_url] |= device
+
+        db_name = self.env.cr.dbname
+        poll_results = []
+        outcomes = {}
+        for api_url, devices in devices_by_bridge.items():
+            start_time = time.perf_counter()
+            configs = [dict(device._get_read_config(), id=device.id) for device in devices]
+            try:
+                with metrics.timed(db_name, devices.ids, 'bridge_http'):
+                    results = bridge_client.read_devices(api_url, configs, timeout=10)
+            except requests.exceptions.RequestException as e:
+                error_msg = f"Could not read devices through Modbus API at {api_url}: {str(e)}"
+                # Errors are logged when they start or change, not at every poll
+                if any(device.last_error != error_msg for device in devices):
+                    _logger.error(error_msg)
+                devices.write({'status': 'error', 'last_error': error_msg})
+                outcomes.update(dict.fromkeys(devices.ids, adaptive.ERROR))
+                continue
+            for device in devices:
+                data = results.get(str(device.id)) or {
+                    'error': 'Device missing from batch response',
+                    'connectionStatus': 'error',
+                }
+                device._record_bridge_timings(data)
+                previous_error = device.last_error
+                previous_values = device.last_values
+                with metrics.timed(db_name, device.ids, 'decode'):
+                    poll_result, message, message_type = device._apply_poll_response(data)
+                if poll_result:
+                    poll_results.append(poll_result)
+                    changed = device.last_values != previous_values
+                    outcomes[device.id] = adaptive.CHANGED if changed else adaptive.STATIC
+                else:
+                    outcomes[device.id] = adaptive.ERROR
+                    if data.get('error') and data.get('error') != previous_error:
+                        _logger.error(message)
+            if _logger.isEnabledFor(logging.DEBUG):
+                _logger.debug("Batch read of %d devices through %s, latency: %.1f ms",
+                              len(devices), api_url, (time.perf_counter() - start_time) * 1000)
+
+        self._store_poll_results(poll_results)
+        return outcomes
+
+    @api.model
+    def _store_stream_events(self, events):
+        """Store the change events pushed by a bridge in streaming mode.
+
+        Each event holds the ``device_id``, ``timestamp`` of the read, the
+        changed ``values``, the full current ``state``, ``connection_status``
+        and ``error``; register map devices also get all current ``blocks`` and
+        the ``changed_blocks``. Only changed values are written to modbus.data.
+        """
+        devices = {device.id: device for device in self.browse({event['device_id'] for event in events}).exists()}
+        latest_events = {}
+        poll_results = []
+        for event in events:
+            device = devices.get(event['device_id'])
+            if not device:
+                continue
+            latest_events[device] = event
+            if event['error']:
+                continue
+            tag_values = device._decode_blocks(event['changed_blocks']) if event.get('changed_blocks') else {}
+            if event['values'] or tag_values:
+                poll_results.append({
+                    'device_id': device.id,
+                    'timestamp': event['timestamp'],
+                    'values': event['values'],
+                    'tag_values': tag_values,
+                })
+
+        for device, event in latest_events.items():
+            tag_values = device._decode_blocks(event['blocks']) if event.get('blocks') else {}
+            formatted_values = device._format_values(event['state'], tag_values)
+            vals = {
+                'status': 'polling' if event['connection_status'] == 'connected' else 'error',
+                'last_values': '\n'.join(formatted_values) if formatted_values else 'No data received',
+                'last_error': event['error'] or False,
+            }
+            # Avoid rewriting the device row when nothing but register values changed
+            vals = {name: value for name, value in vals.items() if device[name] != value}
+            if vals:
+                device.write(vals)
+
+        self._store_poll_results(poll_results)
+
+    @api.model
+    def _dispatch_to_monitors(self, values_by_device):
+        """Hand the register values of one poll to the active device monitors.
+
+        ``values_by_device`` maps a device id to a ``{register (str): value}`` dict.
+        The monitors of all devices are looked up with a single search.
+        """
+        values_by_device = {device_id: values for device_id, values in values_by_device.items() if values}
+        # device.monitor comes from the optional device_monitor module
+        if not values_by_device or 'device.monitor' not in self.env:
+            return
+        references = [f"modbus.device,{device_id}" for device_id in values_by_device]
+        monitors = self.env['device.monitor'].search([('device_id', 'in', references), ('active', '=', True)])
+        for monitor in monitors:
+            register_values = values_by_device.get(monitor.device_id.id)
+            if not register_values:
+                continue
+            if hasattr(monitor, '_process_plc_batch'):
+                monitor._process_plc_batch(register_values)
+            else:
+                # Older device_monitor versions only accept one register at a time
+                for register_num, value in register_values.items():
+                    monitor._process_plc_data(register_num, value)
+
     def action_view_data(self):
+        """Open the history of the device.
+
+        When the context holds a ``date_from`` (and optionally ``date_to``),
+        the rows come from the summary tier that fits that time span.
+        """
         self.ensure_one()
+        date_from = fields.Datetime.to_datetime(self.env.context.get('date_from'))
+        date_to = fields.Datetime.to_datetime(self.env.context.get('date_to')) or fields.Datetime.now()
+        tier = self.env['modbus.data.summary']._select_tier(date_from, date_to) if date_from else 'raw'
+        if tier == 'raw':
+            domain = [('device_id', '=', self.id)]
+            if date_from:
+                domain += [('timestamp', '>=', date_from), ('timestamp', '<=', date_to)]
+            return {
+                'name': 'Historical Data',
+                'type': 'ir.actions.act_window',
+                'res_model': 'modbus.data',
+                'view_mode': 'list,form',
+                'domain': domain,
+                'context': {'default_device_id': self.id}
+            }
         return {
-            'name': 'Historical Data',
+            'name': f'Historical Data ({dict(self.env["modbus.data.summary"]._fields["tier"].selection)[tier]})',
             'type': 'ir.actions.act_window',
-            'res_model': 'modbus.data',
-            'view_mode': 'list,form',
-            'domain': [('device_id', '=', self.id)],
-            'context': {'default_device_id': self.id}
+            'res_model': 'modbus.data.summary',
+            'view_mode': 'graph,list',
+            'domain': [
+                ('device_id', '=', self.id),
+                ('tier', '=', tier),
+                ('bucket_start', '>=', date_from),
+                ('bucket_start', '<=', date_to),
+            ],
         }
 
+    def action_view_trends(self):
+        self.ensure_one()
+        return self.with_context(date_from=fields.Datetime.now() - timedelta(days=30)).action_view_data()
+
     def action_clear_historical_data(self):
         self.ensure_one()
-        # Delete all historical data for this device
-        self.env['modbus.data'].search([('device_id', '=', self.id)]).unlink()
+        # Delete all historical data for this device with set-based deletes
+        # instead of loading every record through the ORM
+        self.env['modbus.data'].flush_model()
+        self.env.cr.execute("DELETE FROM modbus_data WHERE device_id = %s", (self.id,))
+        self.env.cr.execute("DELETE FROM modbus_data_summary WHERE device_id = %s", (self.id,))
+        self.env.cr.execute("DELETE FROM modbus_data_latest WHERE device_id = %s", (self.id,))
+        self.env['modbus.data'].invalidate_model()
+        self.env['modbus.data.summary'].invalidate_model()
+        self.env['modbus.data.latest'].invalidate_model()
+        self.write({'data_count': 0, 'last_sample_at': False})
+        # The next sample must be stored whatever the storage policy
+        forget_device(self.env.cr.dbname, self.id)
         return {
             'type': 'ir.actions.client',
             'tag': 'display_notification',
@@ -328,57 +750,20 @@ class ModbusDevice(models.Model):
                 }
             }
 
-        # Create a new cursor for the thread setup
+        # Commit the flag through a separate cursor right away, the scheduler
+        # reads the polling devices through its own cursor
         with self.env.registry.cursor() as cr:
             env = api.Environment(cr, self.env.uid, self.env.context)
             device = env['modbus.device'].browse(self.id)
-            
-            # Ensure we're not polling and commit this change
-            device.write({'is_polling': False})
-            cr.commit()
-            
-            # Start new polling with fresh state
-            interval = max(1, int(self.polling_interval / 1000))
             device.write({'is_polling': True, 'status': 'polling'})
             cr.commit()
 
-        def poller(device_id, interval):
-            db_name = self.env.cr.dbname
-            uid = self.env.uid
-            context = self.env.context
-            
-            while True:
-                try:
-                    with odoo.registry(db_name).cursor() as cr:
-                        env = api.Environment(cr, uid, context)
-                        device = env['modbus.device'].browse(device_id)
-                        
-                        # Check if polling should continue
-                        if not device.is_polling:
-                            _logger.info(f"Polling stopped for device {device_id}")
-                            break
-                            
-                        _logger.info(f"Polling device {device_id} at interval {interval}s")
-                        device.fetch_data()
-                        cr.commit()
-                        
-                        # Sleep outside the cursor context
-                        time.sleep(interval)
-                except Exception as e:
-                    _logger.error(f"Polling thread for device {device_id} crashed: {e}")
-                    # Ensure we clean up if there's an error
-                    with odoo.registry(db_name).cursor() as cr:
-                        env = api.Environment(cr, uid, context)
-                        device = env['modbus.device'].browse(device_id)
-                        device.write({'is_polling': False, 'status': 'error'})
-                        cr.commit()
-                    break
-
-        thread = threading.Thread(target=poller, args=(self.id, interval), daemon=True)
-        thread.start()
-        
-        _logger.info(f"Started polling thread for device {self.id}")
-        
+        scheduler = get_scheduler(self.env.cr.dbname)
+        scheduler.start()
+        scheduler.wakeup()
+
+        _logger.info("Scheduled polling for device %s every %s ms", self.id, self.polling_interval)
+
         return {
             'type': 'ir.actions.client',
             'tag': 'display_notification',
@@ -399,8 +784,9 @@ class ModbusDevice(models.Model):
                 device = env['modbus.device'].browse(self.id)
                 device.write({'is_polling': False, 'status': 'connected'})
                 cr.commit()
-            
-            _logger.info(f"Stopped polling for device {self.id}")
+            get_scheduler(self.env.cr.dbname).wakeup()
+
+            _logger.info("Stopped polling for device %s", self.id)
             return {
                 'type': 'ir.actions.client',
                 'tag': 'display_notification',
@@ -422,17 +808,3 @@ class ModbusDevice(models.Model):
                     'sticky': False,
                 }
             }
-        
-    def action_clear_historical_data(self):
-        self.ensure_one()
-        self.env['modbus.data'].search([('device_id', '=', self.id)]).unlink()
-        return {
-            'type': 'ir.actions.client',
-            'tag': 'display_notification',
-            'params': {
-                'title': 'Historical Data',
-                'message': 'All historical data has been cleared',
-                'type': 'success',
-                'sticky': False,
-            }
-        }
\ No newline at end of file
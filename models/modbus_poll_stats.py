@@ -0,0 +1,61 @@
+from odoo import models, fields, api
+
+from ..services import metrics
+
+
+class ModbusPollStats(models.Model):
+    _name = 'modbus.poll.stats'
+    _description = 'Modbus Poll Stage Timings'
+    _order = 'device_id, stage'
+
+    device_id = fields.Many2one('modbus.device', string='Device', required=True, ondelete='cascade', readonly=True)
+    stage = fields.Selection([
+        ('bridge_http', 'Bridge HTTP'),
+        ('plc_read', 'PLC Read'),
+        ('decode', 'Decode'),
+        ('db_write', 'Database Write'),
+        ('dispatch', 'Monitor Dispatch'),
+        ('cycle', 'Whole Cycle')
+    ], string='Stage', required=True, readonly=True)
+    sample_count = fields.Integer(string='Samples', readonly=True, aggregator='sum',
+        help="Samples timed by the reporting Odoo process since it started")
+    p50_ms = fields.Float(string='p50 (ms)', readonly=True, aggregator='avg', digits=(16, 2))
+    p95_ms = fields.Float(string='p95 (ms)', readonly=True, aggregator='avg', digits=(16, 2))
+    p99_ms = fields.Float(string='p99 (ms)', readonly=True, aggregator='max', digits=(16, 2))
+    max_ms = fields.Float(string='Max (ms)', readonly=True, aggregator='max', digits=(16, 2))
+
+    _sql_constraints = [
+        ('device_stage_uniq', 'unique (device_id, stage)', 'One timing row per device and stage.'),
+    ]
+
+    @api.model
+    def _flush_metrics(self):
+        """Write the rolling percentiles timed in this process since the previous flush."""
+        stats = metrics.collect(self.env.cr.dbname)
+        if not stats:
+            return
+        device_ids = set(self.env['modbus.device'].browse({device_id for device_id, _stage in stats}).exists().ids)
+        now = fields.Datetime.now()
+        params = []
+        for (device_id, stage), (count, p50, p95, p99, maximum) in stats.items():
+            if device_id not in device_ids:
+                continue
+            params += [device_id, stage, count, p50 * 1000, p95 * 1000, p99 * 1000, maximum * 1000,
+                       self.env.uid, self.env.uid, now, now]
+        if not params:
+            return
+        placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'] * (len(params) // 11))
+        self.env.cr.execute(f"""
+            INSERT INTO modbus_poll_stats
+                (device_id, stage, sample_count, p50_ms, p95_ms, p99_ms, max_ms,
+                 create_uid, write_uid, create_date, write_date)
+            VALUES {placeholders}
+            ON CONFLICT (device_id, stage) DO UPDATE SET
+                sample_count = EXCLUDED.sample_count,
+                p50_ms = EXCLUDED.p50_ms,
+                p95_ms = EXCLUDED.p95_ms,
+                p99_ms = EXCLUDED.p99_ms,
+                max_ms = EXCLUDED.max_ms,
+                write_date = EXCLUDED.write_date
+        """, params)
+        self.invalidate_model()
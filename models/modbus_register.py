@@ -0,0 +1,103 @@
+from odoo import models, fields, api
+from odoo.exceptions import ValidationError
+
+from ..services.historian import StoragePolicy
+from ..services.register_map import DATA_TYPES, FUNCTION_CODES, TagCodec
+
+
+class ModbusRegister(models.Model):
+    _name = 'modbus.register'
+    _description = 'Modbus Register Map Entry'
+    _order = 'device_id, sequence, id'
+
+    device_id = fields.Many2one('modbus.device', string='Device', required=True, ondelete='cascade', index=True)
+    sequence = fields.Integer(string='Sequence', default=10)
+    name = fields.Char(string='Tag', required=True)
+    active = fields.Boolean(string='Active', default=True)
+    register_type = fields.Selection([
+        ('coil', 'Coil (FC1)'),
+        ('discrete_input', 'Discrete Input (FC2)'),
+        ('holding_register', 'Holding Register (FC3)'),
+        ('input_register', 'Input Register (FC4)')
+    ], string='Register Type', required=True, default='holding_register')
+    address = fields.Integer(string='Address', required=True, default=0)
+    data_type = fields.Selection([
+        ('bool', 'Boolean'),
+        ('int16', 'INT16'),
+        ('uint16', 'UINT16'),
+        ('int32', 'INT32'),
+        ('uint32', 'UINT32'),
+        ('float32', 'FLOAT32'),
+        ('float64', 'FLOAT64')
+    ], string='Data Type', required=True, default='uint16')
+    byte_order = fields.Selection([
+        ('big', 'Big Endian (AB)'),
+        ('little', 'Little Endian (BA)')
+    ], string='Byte Order', required=True, default='big', help="Order of the two bytes inside each register")
+    word_order = fields.Selection([
+        ('big', 'High Word First'),
+        ('little', 'Low Word First')
+    ], string='Word Order', required=True, default='big', help="Order of the registers of multi-register values")
+    scale = fields.Float(string='Scale', default=1.0, help="Stored value = raw value * scale + offset")
+    offset = fields.Float(string='Offset', default=0.0)
+    storage_policy = fields.Selection([
+        ('device', 'Device Default'),
+        ('all', 'Every Sample'),
+        ('change', 'On Change'),
+        ('deadband_abs', 'Absolute Deadband'),
+        ('deadband_pct', 'Percent Deadband')
+    ], string='Storage Policy', required=True, default='device')
+    deadband = fields.Float(string='Deadband', help="In engineering units (after scale) or in % of the last stored value")
+    heartbeat_interval = fields.Integer(string='Heartbeat Interval (s)', default=0)
+
+    @api.constrains('register_type', 'data_type')
+    def _check_data_type(self):
+        for record in self:
+            is_bit = record.register_type in ('coil', 'discrete_input')
+            if is_bit != (record.data_type == 'bool'):
+                raise ValidationError(
+                    f"Tag {record.name}: coils and discrete inputs must use the Boolean data type, "
+                    "holding and input registers a numeric one.")
+
+    @api.constrains('address')
+    def _check_address(self):
+        for record in self:
+            if not 0 <= record.address <= 65535:
+                raise ValidationError(f"Tag {record.name}: address must be between 0 and 65535")
+
+    def _get_storage_policy(self):
+        """Return the ``StoragePolicy`` of the tag, falling back to the device one."""
+        self.ensure_one()
+        if self.storage_policy == 'device':
+            return self.device_id._get_storage_policy()
+        return StoragePolicy(self.storage_policy, self.deadband, self.heartbeat_interval)
+
+    def _get_codecs(self):
+        """Return the ``TagCodec`` of each tag, used to plan reads and decode them."""
+        codecs = []
+        for record in self:
+            words, fmt = DATA_TYPES[record.data_type]
+            codecs.append(TagCodec(
+                id=record.id,
+                function_code=FUNCTION_CODES[record.register_type],
+                address=record.address,
+                words=words,
+                fmt=fmt,
+                byte_swap=record.byte_order == 'little',
+                word_swap=record.word_order == 'little',
+                scale=record.scale,
+                offset=record.offset,
+            ))
+        return codecs
+
+    def unlink(self):
+        # The history of a deleted tag falls back to raw register rows (set null):
+        # recompute the latest raw values of its registers, its own latest rows cascade
+        self.env['modbus.data.latest'].flush_model()
+        self.env.cr.execute("""
+            SELECT DISTINCT device_id, register_number FROM modbus_data_latest WHERE register_id = ANY(%s)
+        """, (self.ids,))
+        keys = [(device_id, register_number, None) for device_id, register_number in self.env.cr.fetchall()]
+        result = super().unlink()
+        self.env['modbus.data.latest']._refresh(keys)
+        return result
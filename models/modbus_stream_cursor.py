@@ -0,0 +1,43 @@
+from odoo import models, fields, api
+
+
+class BigInteger(fields.Integer):
+    """Integer field stored in an int8 column."""
+    column_type = ('int8', 'int8')
+    # Earlier versions of the module stored the log position as int4, then as text
+    column_cast_from = ('int4', 'varchar')
+
+
+class ModbusStreamCursor(models.Model):
+    _name = 'modbus.stream.cursor'
+    _description = 'Modbus Bridge Log Position'
+
+    api_url = fields.Char(string='API URL', required=True, readonly=True)
+    epoch = fields.Char(string='Log Id', readonly=True, help="Id of the store-and-forward log of the bridge")
+    # The sequence of a bridge log never restarts and outgrows int4
+    seq = BigInteger(string='Last Stored Event', readonly=True)
+
+    _sql_constraints = [
+        ('api_url_uniq', 'unique (api_url)', 'One log position per bridge.'),
+    ]
+
+    @api.model
+    def _get_cursor(self, api_url):
+        """Return the ``(epoch, seq)`` of the last event of a bridge log stored in Odoo."""
+        self.env.cr.execute("SELECT epoch, seq FROM modbus_stream_cursor WHERE api_url = %s", (api_url,))
+        row = self.env.cr.fetchone()
+        return (row[0], row[1] or 0) if row else (None, 0)
+
+    @api.model
+    def _set_cursor(self, api_url, epoch, seq):
+        """Record the last stored event, in the transaction that stored it."""
+        now = fields.Datetime.now()
+        self.env.cr.execute("""
+            INSERT INTO modbus_stream_cursor AS c
+                (api_url, epoch, seq, create_uid, write_uid, create_date, write_date)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (api_url) DO UPDATE SET
+                epoch = EXCLUDED.epoch,
+                seq = EXCLUDED.seq,
+                write_date = EXCLUDED.write_date
+        """, (api_url, epoch, seq, self.env.uid, self.env.uid, now, now))
@@ -1,106 +1,891 @@
 const ModbusRTU = require("modbus-serial");
 const express = require("express");
+const crypto = require("crypto");
+const fs = require("fs");
+const path = require("path");
 require('dotenv').config();
 
 const app = express();
 const port = process.env.API_PORT || 3001;
 
+// LOG_LEVEL=error|warn|info|debug (default info). Per-request traces are only
+// written at debug, so steady polling logs nothing at the default level.
+const LOG_LEVELS = { error: 0, warn: 1, info: 2, debug: 3 };
+const logLevel = LOG_LEVELS[(process.env.LOG_LEVEL || 'info').toLowerCase()] ?? LOG_LEVELS.info;
+const isDebug = logLevel >= LOG_LEVELS.debug;
+const log = {
+    error: (...args) => logLevel >= LOG_LEVELS.error && console.error(...args),
+    warn: (...args) => logLevel >= LOG_LEVELS.warn && console.warn(...args),
+    info: (...args) => logLevel >= LOG_LEVELS.info && console.log(...args),
+    debug: (...args) => isDebug && console.log(...args)
+};
+
 // Enable JSON parsing for POST requests
 app.use(express.json());
 
-// Connection pool to store multiple Modbus clients
-const connectionPool = new Map();
+// One connection per Modbus TCP endpoint (ip:port), shared by every slave id
+// behind it (e.g. a serial gateway). Requests go through a queue per endpoint
+// that keeps at most maxInFlight transactions outstanding on the socket; the
+// responses are matched to their requests by the MBAP transaction id.
+const DEFAULT_MAX_IN_FLIGHT = Number(process.env.MAX_IN_FLIGHT) || 1;
+const REQUEST_TIMEOUT_MS = Number(process.env.REQUEST_TIMEOUT_MS) || 3000;
+const CONNECT_TIMEOUT_MS = Number(process.env.CONNECT_TIMEOUT_MS) || 5000;
+const IDLE_TIMEOUT_MS = Number(process.env.IDLE_TIMEOUT_MS) || 60000;
+// Time each device of a /data/batch request gets before it is answered with a
+// timeout error, unless the request sets deadlineMs; keeps a few dead slaves
+// from holding the whole batch past the client timeout
+const BATCH_DEADLINE_MS = Number(process.env.BATCH_DEADLINE_MS) || 8000;
+// Reconnect delay after consecutive failures: 0.5 s, 1 s, 2 s ... up to 30 s
+const RECONNECT_BACKOFF_MIN_MS = 500;
+const RECONNECT_BACKOFF_MAX_MS = 30000;
+
+const endpoints = new Map();
 
 // Function to get a unique key for each PLC
 const getPlcKey = (ip, port, slaveId) => `${ip}:${port}:${slaveId}`;
 
-// Function to get or create a Modbus client
-const getModbusClient = async (ip, port, slaveId) => {
-    const key = getPlcKey(ip, port, slaveId);
-    
-    if (!connectionPool.has(key)) {
-        const client = new ModbusRTU();
-        connectionPool.set(key, client);
+// Function to get or create the endpoint of a PLC. Each slave id keeps its own
+// maxInFlight setting and the endpoint pipelines the smallest of them, so one
+// device cannot raise the depth for the other slaves behind the same gateway.
+const getEndpoint = (ip, port, slaveId, maxInFlight) => {
+    const key = `${ip}:${port}`;
+    let endpoint = endpoints.get(key);
+    if (!endpoint) {
+        endpoint = {
+            key, ip, port,
+            client: null,
+            connecting: null,
+            queue: [],
+            inFlight: new Set(),
+            maxInFlight: DEFAULT_MAX_IN_FLIGHT,
+            slaveMaxInFlight: new Map(),
+            failures: 0,
+            retryAt: 0,
+            lastError: null,
+            lastUsed: Date.now()
+        };
+        endpoints.set(key, endpoint);
     }
-    
-    const client = connectionPool.get(key);
-    
-    if (!client.isOpen) {
-        console.log(`Creating new connection to ${ip}:${port} (Slave ID: ${slaveId})`);
-        await client.connectTCP(ip, { port: port });
-        client.setID(slaveId);
+    const limit = Math.floor(Number(maxInFlight));
+    if (limit >= 1 && endpoint.slaveMaxInFlight.get(slaveId) !== limit) {
+        endpoint.slaveMaxInFlight.set(slaveId, limit);
+        endpoint.maxInFlight = Math.min(...endpoint.slaveMaxInFlight.values());
     }
-    
-    return client;
+    endpoint.lastUsed = Date.now();
+    return endpoint;
 };
 
-// Function to close a specific PLC connection
-const closePlcConnection = async (ip, port, slaveId) => {
-    const key = getPlcKey(ip, port, slaveId);
-    if (connectionPool.has(key)) {
-        const client = connectionPool.get(key);
-        if (client.isOpen) {
-            await client.close();
-        }
-        connectionPool.delete(key);
+// Function to close the socket of an endpoint. After a failure the next
+// connection attempt is delayed with an exponential backoff, and the
+// transactions still waiting for an answer are failed right away.
+const resetEndpoint = (endpoint, error) => {
+    const client = endpoint.client;
+    endpoint.client = null;
+    if (client && client.isOpen) {
+        client.close(() => {});
     }
+    if (error) {
+        endpoint.failures += 1;
+        const backoff = Math.min(RECONNECT_BACKOFF_MAX_MS, RECONNECT_BACKOFF_MIN_MS * 2 ** (endpoint.failures - 1));
+        // Jitter keeps the endpoints of a flapping network from reconnecting in lockstep
+        endpoint.retryAt = Date.now() + backoff * (0.8 + Math.random() * 0.4);
+        endpoint.lastError = error.message;
+    }
+    for (const job of endpoint.inFlight) {
+        job.reject(error || new Error('Connection closed'));
+    }
+    endpoint.inFlight.clear();
 };
 
-// REST API endpoints
-app.post("/data", async (req, res) => {
-    const { ip, port, slaveId, startingRegister, numberOfRegisters } = req.body;
-    
-    const start_time = Date.now(); //for measuring the time it takes to fetch data
+// Function to get the open client of an endpoint, connecting it if needed.
+// Concurrent callers share one connection attempt.
+const connectEndpoint = (endpoint) => {
+    if (endpoint.client && endpoint.client.isOpen) {
+        return Promise.resolve(endpoint.client);
+    }
+    if (endpoint.connecting) {
+        return endpoint.connecting;
+    }
+    if (Date.now() < endpoint.retryAt) {
+        // Same error as the failed attempt, so a PLC that stays down reports
+        // one stable error (logged once, one stream event) until it changes
+        return Promise.reject(new Error(endpoint.lastError));
+    }
 
-    // Validate input
-    if (!ip || port === undefined || slaveId === undefined || startingRegister === undefined || numberOfRegisters === undefined) {
-        console.error("❌ Invalid data request: Missing configuration parameters in body", req.body);
-        return res.status(400).json({
-            error: "Invalid request",
-            message: "Missing configuration parameters (ip, port, slaveId, startingRegister, numberOfRegisters)",
-            connectionStatus: 'error'
+    // Reconnection attempts to a failing PLC are only traced at debug
+    (endpoint.failures ? log.debug : log.info)(`Creating new connection to ${endpoint.key}`);
+    const client = new ModbusRTU();
+    client.setTimeout(REQUEST_TIMEOUT_MS);
+    let timer;
+    const timeout = new Promise((resolve, reject) => {
+        timer = setTimeout(() => reject(new Error(`Timed out connecting to ${endpoint.key}`)), CONNECT_TIMEOUT_MS);
+    });
+    endpoint.connecting = Promise.race([client.connectTCP(endpoint.ip, { port: endpoint.port }), timeout])
+        .then(() => {
+            endpoint.client = client;
+            endpoint.failures = 0;
+            endpoint.lastError = null;
+            client.on('close', () => {
+                if (endpoint.client === client) {
+                    resetEndpoint(endpoint, new Error(`Connection to ${endpoint.key} closed by the peer`));
+                }
+            });
+            return client;
+        })
+        .catch((error) => {
+            if (client.isOpen) {
+                client.close(() => {});
+            }
+            resetEndpoint(endpoint, error);
+            throw error;
+        })
+        .finally(() => {
+            clearTimeout(timer);
+            endpoint.connecting = null;
         });
+    return endpoint.connecting;
+};
+
+// Raw request senders of modbus-serial for each read function code; unlike the
+// promise API they take the slave id of each request
+const requestFunctions = { 1: 'writeFC1', 2: 'writeFC2', 3: 'writeFC3', 4: 'writeFC4' };
+
+// Function to start queued requests while the endpoint has room for them
+const pumpEndpoint = (endpoint) => {
+    while (endpoint.queue.length > 0 && endpoint.inFlight.size < endpoint.maxInFlight) {
+        const job = endpoint.queue.shift();
+        endpoint.inFlight.add(job);
+        connectEndpoint(endpoint)
+            .then((client) => new Promise((resolve, reject) => {
+                client[requestFunctions[job.functionCode]](job.slaveId, job.address, job.count,
+                    (error, response) => (error ? reject(error) : resolve(response)));
+            }).catch((error) => {
+                // A Modbus exception response leaves the connection usable, and
+                // so does a transaction timeout: that is one slave not answering
+                // on a shared gateway socket, and modbus-serial drops a late
+                // answer to a timed out transaction id. Other errors are socket
+                // failures, which close the connection and back off.
+                const slaveError = error.modbusCode !== undefined || error.name === 'TransactionTimedOutError';
+                if (!slaveError && endpoint.client === client && endpoint.inFlight.has(job)) {
+                    resetEndpoint(endpoint, error);
+                }
+                throw error;
+            }))
+            .then(job.resolve, job.reject)
+            .finally(() => {
+                endpoint.inFlight.delete(job);
+                endpoint.lastUsed = Date.now();
+                pumpEndpoint(endpoint);
+            });
+    }
+};
+
+// Function to queue one read request on an endpoint
+const request = (endpoint, slaveId, functionCode, address, count) => new Promise((resolve, reject) => {
+    endpoint.queue.push({ slaveId, functionCode, address, count, resolve, reject });
+    pumpEndpoint(endpoint);
+});
+
+// Close the connections that have not been used for IDLE_TIMEOUT_MS
+setInterval(() => {
+    const now = Date.now();
+    for (const endpoint of endpoints.values()) {
+        if (endpoint.queue.length === 0 && endpoint.inFlight.size === 0 && !endpoint.connecting
+                && now - endpoint.lastUsed > IDLE_TIMEOUT_MS) {
+            log.debug(`Closing idle connection to ${endpoint.key}`);
+            resetEndpoint(endpoint, null);
+            endpoints.delete(endpoint.key);
+        }
     }
+}, Math.min(IDLE_TIMEOUT_MS, 10000)).unref();
+
+// Largest quantity one request may ask for, per read function code
+const MAX_READ_COUNT = { 1: 2000, 2: 2000, 3: 125, 4: 125 };
+
+// Function to merge reads of the same function code into the fewest requests.
+// Reads are merged while the hole between them is at most maxGap addresses and
+// the block stays within the PDU limit of the function code.
+const planReads = (reads, maxGap = 0) => {
+    const blocks = [];
+    const sorted = [...reads].sort((a, b) => a.functionCode - b.functionCode || a.address - b.address);
+    let current = null;
+    for (const read of sorted) {
+        const readEnd = read.address + read.count;
+        if (current && current.functionCode === read.functionCode
+                && read.address - (current.address + current.count) <= maxGap
+                && Math.max(current.address + current.count, readEnd) - current.address <= MAX_READ_COUNT[read.functionCode]) {
+            current.count = Math.max(current.address + current.count, readEnd) - current.address;
+            continue;
+        }
+        current = { functionCode: read.functionCode, address: read.address, count: read.count };
+        blocks.push(current);
+    }
+    return blocks;
+};
+
+// Function to read a list of { functionCode, address, count } with as few requests as possible.
+// The answer holds one { functionCode, address, count, values } per requested read.
+// All blocks are queued at once, so they are pipelined when the endpoint allows it.
+const readBlocks = async (endpoint, slaveId, reads, maxGap) => {
+    const blocks = planReads(reads, maxGap);
+    await Promise.all(blocks.map(async (block) => {
+        const response = await request(endpoint, slaveId, block.functionCode, block.address, block.count);
+        // Coils and discrete inputs come back as booleans padded to whole bytes
+        block.values = response.data.slice(0, block.count).map(Number);
+    }));
+    return reads.map((read) => {
+        const block = blocks.find((candidate) => candidate.functionCode === read.functionCode
+            && candidate.address <= read.address
+            && read.address + read.count <= candidate.address + candidate.count);
+        const start = read.address - block.address;
+        return { ...read, values: block.values.slice(start, start + read.count) };
+    });
+};
+
+// Rolling windows of the stage durations of each PLC, exposed on /metrics
+const METRICS_WINDOW_SIZE = 1024;
+const stageTimings = new Map();
+const readErrors = new Map();
+// Last error message of each PLC, until it reads fine again
+const lastErrors = new Map();
+
+const elapsedMs = (start) => Number(process.hrtime.bigint() - start) / 1e6;
+
+// Function to add one duration (ms) of a stage to the rolling window of a PLC
+const recordTiming = (plc, stage, ms) => {
+    const key = `${plc}|${stage}`;
+    let timing = stageTimings.get(key);
+    if (!timing) {
+        timing = { plc, stage, samples: [], next: 0, count: 0, sum: 0 };
+        stageTimings.set(key, timing);
+    }
+    if (timing.samples.length < METRICS_WINDOW_SIZE) {
+        timing.samples.push(ms);
+    } else {
+        timing.samples[timing.next] = ms;
+        timing.next = (timing.next + 1) % METRICS_WINDOW_SIZE;
+    }
+    timing.count += 1;
+    timing.sum += ms;
+};
+
+// Nearest-rank quantile of a sorted, non-empty array
+const quantile = (sorted, q) => sorted[Math.max(1, Math.ceil(sorted.length * q)) - 1];
+
+// Function to read one device: the planned reads of its register map if given,
+// else its holding register window. The answer carries the time spent
+// connecting and reading in timings, in milliseconds.
+const readDevice = async (config) => {
+    const { ip, port, slaveId, startingRegister, numberOfRegisters, reads, maxReadGap, maxInFlight } = config;
+    const plc = getPlcKey(ip, port, slaveId);
+    const start_time = process.hrtime.bigint(); //for measuring the time it takes to fetch data
 
     let responseData = {
         values: [],
         timestamp: null,
         error: null,
-        connectionStatus: 'disconnected'
+        connectionStatus: 'disconnected',
+        timings: { connectMs: 0, readMs: 0 }
     };
 
     try {
-        const client = await getModbusClient(ip, port, slaveId);
-        console.log(`Reading registers: Starting at ${startingRegister}, Count: ${numberOfRegisters}`);
-        const response = await client.readHoldingRegisters(startingRegister, numberOfRegisters);
-
-        responseData.values = response.data;
+        const endpoint = getEndpoint(ip, port, slaveId, maxInFlight);
+        await connectEndpoint(endpoint);
+        responseData.timings.connectMs = elapsedMs(start_time);
+        const read_time = process.hrtime.bigint();
+        if (Array.isArray(reads)) {
+            if (isDebug) log.debug(`Reading ${reads.length} register map blocks from ${plc}`);
+            responseData.blocks = await readBlocks(endpoint, slaveId, reads, maxReadGap || 0);
+        } else {
+            if (isDebug) log.debug(`Reading registers of ${plc}: Starting at ${startingRegister}, Count: ${numberOfRegisters}`);
+            const response = await request(endpoint, slaveId, 3, startingRegister, numberOfRegisters);
+            responseData.values = response.data;
+        }
+        responseData.timings.readMs = elapsedMs(read_time);
         responseData.timestamp = new Date().toISOString();
         responseData.connectionStatus = 'connected';
 
+        recordTiming(plc, 'connect', responseData.timings.connectMs);
+        recordTiming(plc, 'read', responseData.timings.readMs);
         // Calculate and log latency
-        const end_time = Date.now();
-        const fetch_time = end_time - start_time;
-        console.log(`Time taken to fetch data for ${ip}:${port}: ${fetch_time} ms`);
-
-        console.log(`Read successful for ${ip}:${port}:`, response.data);
+        const fetch_time = elapsedMs(start_time);
+        recordTiming(plc, 'total', fetch_time);
+        if (isDebug) {
+            log.debug(`Time taken to fetch data for ${ip}:${port}: ${fetch_time} ms`);
+            log.debug(`Read successful for ${ip}:${port}:`, responseData.blocks || responseData.values);
+        }
+        lastErrors.delete(plc);
 
     } catch (error) {
-        console.error(`❌ Error processing data request for ${ip}:${port}:`, error.message);
+        // A PLC that keeps failing the same way is only reported once
+        if (lastErrors.get(plc) !== error.message) {
+            log.error(`❌ Error processing data request for ${ip}:${port}:`, error.message);
+            lastErrors.set(plc, error.message);
+        }
         responseData.error = `Error: ${error.message}`;
         responseData.connectionStatus = 'error';
-        
-        // Close the connection on error
-        await closePlcConnection(ip, port, slaveId);
+        readErrors.set(plc, (readErrors.get(plc) || 0) + 1);
+        // The endpoint already dropped its connection if the error requires it
     }
 
-    console.log("Sending data response for request:", responseData);
+    return responseData;
+};
+
+// Last successful answer of each distinct read (PLC and registers), served to
+// requests that accept values up to maxAgeMs old, and the reads in progress,
+// shared by identical requests arriving meanwhile
+const MAX_CACHE_AGE_MS = Number(process.env.MAX_CACHE_AGE_MS) || 60000;
+const lastValues = new Map();
+const inFlightReads = new Map();
+
+const getReadKey = (config) => `${getPlcKey(config.ip, config.port, config.slaveId)}|`
+    + (Array.isArray(config.reads)
+        ? `${config.maxReadGap || 0}|${config.reads.map((read) => `${read.functionCode}:${read.address}:${read.count}`).join(',')}`
+        : `3:${config.startingRegister}:${config.numberOfRegisters}`);
+
+// Function to read a device unless a recent enough answer is cached or the
+// same read is already running. Cached answers carry cached: true and ageMs.
+const readDeviceShared = async (config) => {
+    const key = getReadKey(config);
+    const maxAgeMs = Math.min(Number(config.maxAgeMs) || 0, MAX_CACHE_AGE_MS);
+    const cached = lastValues.get(key);
+    if (maxAgeMs > 0 && cached && Date.now() - cached.at <= maxAgeMs) {
+        return { ...cached.responseData, cached: true, ageMs: Date.now() - cached.at };
+    }
+
+    let reading = inFlightReads.get(key);
+    if (!reading) {
+        reading = readDevice(config)
+            .then((responseData) => {
+                if (!responseData.error) {
+                    lastValues.set(key, { at: Date.now(), responseData });
+                }
+                return responseData;
+            })
+            .finally(() => inFlightReads.delete(key));
+        inFlightReads.set(key, reading);
+    }
+    return { ...(await reading) };
+};
+
+// Function to read a device, answering a timeout error if that takes longer
+// than deadlineMs. The read itself goes on and still fills the cache.
+const readWithDeadline = (config, deadlineMs) => {
+    let timer;
+    const timeout = new Promise((resolve) => {
+        timer = setTimeout(() => resolve({
+            values: [],
+            timestamp: null,
+            error: `Error: No answer from ${getPlcKey(config.ip, config.port, config.slaveId)} within ${deadlineMs} ms`,
+            connectionStatus: 'error',
+            timings: { connectMs: 0, readMs: 0 }
+        }), deadlineMs);
+    });
+    return Promise.race([readDeviceShared(config), timeout]).finally(() => clearTimeout(timer));
+};
+
+// Drop the cached answers nobody may ask for anymore
+setInterval(() => {
+    const now = Date.now();
+    for (const [key, cached] of lastValues) {
+        if (now - cached.at > MAX_CACHE_AGE_MS) {
+            lastValues.delete(key);
+        }
+    }
+}, MAX_CACHE_AGE_MS).unref();
+
+// Function to check a register map read
+const isValidRead = (read) => Boolean(requestFunctions[read.functionCode])
+    && Number.isInteger(read.address) && Number.isInteger(read.count)
+    && read.count > 0 && read.count <= MAX_READ_COUNT[read.functionCode];
+
+// Function to check that a device configuration is complete
+const isValidConfig = (config) => Boolean(config) && Boolean(config.ip) && config.port !== undefined
+    && config.slaveId !== undefined
+    && (config.reads !== undefined
+        ? Array.isArray(config.reads) && config.reads.every(isValidRead)
+        : config.startingRegister !== undefined && config.numberOfRegisters !== undefined);
+
+// REST API endpoints
+app.post("/data", async (req, res) => {
+    // Validate input
+    if (!isValidConfig(req.body)) {
+        log.warn("❌ Invalid data request: Missing configuration parameters in body", req.body);
+        return res.status(400).json({
+            error: "Invalid request",
+            message: "Missing configuration parameters (ip, port, slaveId, startingRegister, numberOfRegisters)",
+            connectionStatus: 'error'
+        });
+    }
+
+    const responseData = await readDeviceShared(req.body);
+
+    if (isDebug) log.debug("Sending data response for request:", responseData);
     res.json(responseData);
 });
 
+// Read several devices concurrently, results are keyed by each config's id
+app.post("/data/batch", async (req, res) => {
+    const devices = req.body && req.body.devices;
+
+    // Validate input
+    if (!Array.isArray(devices) || devices.some((config) => !isValidConfig(config) || config.id === undefined)) {
+        log.warn("❌ Invalid batch request: Every device needs an id and a full configuration", req.body);
+        return res.status(400).json({
+            error: "Invalid request",
+            message: "Body must be { devices: [...] } with id, ip, port, slaveId, startingRegister, numberOfRegisters per device",
+            connectionStatus: 'error'
+        });
+    }
+
+    const start_time = Date.now();
+    const deadlineMs = Number(req.body.deadlineMs) || BATCH_DEADLINE_MS;
+    const responses = await Promise.all(devices.map((config) => readWithDeadline(config, deadlineMs)));
+    const results = {};
+    devices.forEach((config, index) => {
+        results[String(config.id)] = responses[index];
+    });
+    if (isDebug) log.debug(`Batch read of ${devices.length} devices took ${Date.now() - start_time} ms`);
+
+    res.json({ results });
+});
+
+// Store-and-forward log: every change event of the subscriptions is appended
+// to JSON-lines segment files with a sequence number before it is pushed, so
+// Odoo can catch up on what it missed while it was down (GET /buffer). The
+// log is bounded by size, the oldest segments going first, and segments Odoo
+// acknowledged (POST /buffer/ack) are deleted.
+const BUFFER_DIR = process.env.BUFFER_DIR || path.join(__dirname, 'buffer');
+const BUFFER_MAX_BYTES = Number(process.env.BUFFER_MAX_BYTES) || 256 * 1024 * 1024;
+const BUFFER_SEGMENT_BYTES = Math.min(8 * 1024 * 1024, BUFFER_MAX_BYTES);
+const BUFFER_READ_LIMIT = 5000;
+
+const buffer = {
+    epoch: null,      // id of this log, changes when the log is recreated
+    lastSeq: 0,
+    ackedSeq: 0,
+    segments: [],     // { firstSeq, file, bytes }, oldest first
+    fd: null
+};
+
+const segmentFile = (firstSeq) => path.join(BUFFER_DIR, `segment-${String(firstSeq).padStart(16, '0')}.log`);
+
+const saveBufferMeta = () => {
+    fs.writeFileSync(path.join(BUFFER_DIR, 'meta.json'), JSON.stringify({ epoch: buffer.epoch, ackedSeq: buffer.ackedSeq }));
+};
+
+// Function to parse a line of a segment, null when it is damaged
+const parseBufferLine = (line, file) => {
+    try {
+        const event = JSON.parse(line);
+        if (Number.isInteger(event.seq)) {
+            return event;
+        }
+    } catch (error) {
+        // Reported below
+    }
+    log.warn(`Skipping a damaged line of ${file}`);
+    return null;
+};
+
+// Function to load the log left by a previous run, or create a new one
+const openBuffer = () => {
+    fs.mkdirSync(BUFFER_DIR, { recursive: true });
+    try {
+        const meta = JSON.parse(fs.readFileSync(path.join(BUFFER_DIR, 'meta.json'), 'utf8'));
+        buffer.epoch = meta.epoch;
+        buffer.ackedSeq = meta.ackedSeq || 0;
+    } catch (error) {
+        buffer.epoch = crypto.randomUUID();
+        saveBufferMeta();
+    }
+    buffer.segments = fs.readdirSync(BUFFER_DIR)
+        .filter((file) => /^segment-\d+\.log$/.test(file))
+        .sort()
+        .map((file) => ({
+            firstSeq: Number(file.slice(8, -4)),
+            file: path.join(BUFFER_DIR, file),
+            bytes: fs.statSync(path.join(BUFFER_DIR, file)).size
+        }));
+    const last = buffer.segments[buffer.segments.length - 1];
+    if (last) {
+        // A line torn by a crash is cut off, the events after it would not parse
+        const content = fs.readFileSync(last.file, 'utf8');
+        const end = content.lastIndexOf('\n') + 1;
+        if (end < content.length) {
+            log.warn(`Dropping the torn last line of ${last.file}`);
+            fs.truncateSync(last.file, Buffer.byteLength(content.slice(0, end)));
+            last.bytes = fs.statSync(last.file).size;
+        }
+        buffer.lastSeq = last.firstSeq - 1;
+        for (const line of content.slice(0, end).split('\n').filter(Boolean).reverse()) {
+            const event = parseBufferLine(line, last.file);
+            if (event) {
+                buffer.lastSeq = event.seq;
+                break;
+            }
+        }
+        buffer.fd = fs.openSync(last.file, 'a');
+    }
+    buffer.lastSeq = Math.max(buffer.lastSeq, buffer.ackedSeq);
+    log.info(`Store-and-forward log at ${BUFFER_DIR}: ${buffer.segments.length} segments, last sequence ${buffer.lastSeq}`);
+};
+
+// Function to delete the acknowledged segments and the oldest ones beyond BUFFER_MAX_BYTES
+const trimBuffer = () => {
+    let total = buffer.segments.reduce((sum, segment) => sum + segment.bytes, 0);
+    while (buffer.segments.length > 1) {
+        const oldest = buffer.segments[0];
+        const acked = buffer.segments[1].firstSeq - 1 <= buffer.ackedSeq;
+        if (!acked && total <= BUFFER_MAX_BYTES) {
+            break;
+        }
+        if (!acked) {
+            log.warn(`Store-and-forward log full, dropping the events from sequence ${oldest.firstSeq}`);
+        }
+        fs.unlinkSync(oldest.file);
+        total -= oldest.bytes;
+        buffer.segments.shift();
+    }
+};
+
+// Function to append an event to the log and return it with its sequence number.
+// Writes are synchronous so a /buffer read always sees every event already pushed.
+const appendToBuffer = (payload) => {
+    const event = { seq: buffer.lastSeq + 1, ...payload };
+    const line = `${JSON.stringify(event)}\n`;
+    let segment = buffer.segments[buffer.segments.length - 1];
+    if (!segment || segment.bytes >= BUFFER_SEGMENT_BYTES) {
+        if (buffer.fd !== null) {
+            fs.closeSync(buffer.fd);
+        }
+        segment = { firstSeq: event.seq, file: segmentFile(event.seq), bytes: 0 };
+        buffer.segments.push(segment);
+        buffer.fd = fs.openSync(segment.file, 'a');
+        trimBuffer();
+    }
+    try {
+        fs.writeSync(buffer.fd, line);
+    } catch (error) {
+        // Drop a partly written line so the next events do not follow a torn one
+        try {
+            fs.ftruncateSync(buffer.fd, segment.bytes);
+        } catch (truncateError) {
+            log.debug(`Could not truncate ${segment.file}: ${truncateError.message}`);
+        }
+        throw error;
+    }
+    segment.bytes += Buffer.byteLength(line);
+    buffer.lastSeq = event.seq;
+    return event;
+};
+
+// Function to read at most limit events with a sequence number above after
+const readBuffer = (after, limit) => {
+    const events = [];
+    for (let index = 0; index < buffer.segments.length && events.length < limit; index++) {
+        const next = buffer.segments[index + 1];
+        if (next && next.firstSeq - 1 <= after) {
+            continue;
+        }
+        for (const line of fs.readFileSync(buffer.segments[index].file, 'utf8').split('\n')) {
+            if (!line) {
+                continue;
+            }
+            const event = parseBufferLine(line, buffer.segments[index].file);
+            if (event && event.seq > after) {
+                events.push(event);
+                if (events.length >= limit) {
+                    break;
+                }
+            }
+        }
+    }
+    return events;
+};
+
+// Subscriptions polled locally by the bridge; changed values are pushed to /stream clients.
+// They are saved with the log so the bridge keeps polling after a restart, even while Odoo is down.
+const subscriptions = new Map();
+const streamClients = new Set();
+const MIN_SUBSCRIPTION_INTERVAL_MS = 100;
+const STREAM_HEARTBEAT_MS = 15000;
+const SUBSCRIPTIONS_FILE = path.join(BUFFER_DIR, 'subscriptions.json');
+
+const saveSubscriptions = () => {
+    fs.writeFileSync(SUBSCRIPTIONS_FILE, JSON.stringify(Array.from(subscriptions.values()).map((subscription) => subscription.config)));
+};
+
+const sendEvent = (res, event, payload) => {
+    res.write(`event: ${event}\ndata: ${JSON.stringify(payload)}\n\n`);
+};
+
+// Events that could not be logged (e.g. disk full) are still pushed, without a
+// sequence number, like the snapshots
+const broadcast = (payload) => {
+    let event = payload;
+    try {
+        event = appendToBuffer(payload);
+    } catch (error) {
+        log.error(`❌ Could not append to the store-and-forward log: ${error.message}`);
+    }
+    for (const res of streamClients) {
+        sendEvent(res, 'data', event);
+    }
+};
+
+// Current state of a subscription, sent to clients when they (re)connect
+const subscriptionSnapshot = (subscription) => ({
+    id: subscription.config.id,
+    timestamp: subscription.timestamp,
+    values: subscription.values,
+    blocks: Object.values(subscription.blocks),
+    connectionStatus: subscription.connectionStatus,
+    error: subscription.error
+});
+
+const pollSubscription = async (subscription) => {
+    const start_time = Date.now();
+    try {
+        await pollSubscriptionOnce(subscription);
+    } catch (error) {
+        log.error(`❌ Polling of subscription ${subscription.config.id} failed: ${error.message}`);
+    } finally {
+        // Keep the period steady whatever the read time
+        if (!subscription.stopped) {
+            const delay = Math.max(0, subscription.intervalMs - (Date.now() - start_time));
+            subscription.timer = setTimeout(() => pollSubscription(subscription), delay);
+        }
+    }
+};
+
+const pollSubscriptionOnce = async (subscription) => {
+    // Subscriptions refresh the cache and share reads with /data requests
+    const responseData = await readDeviceShared({ ...subscription.config, maxAgeMs: 0 });
+    if (subscription.stopped) {
+        return;
+    }
+
+    // Only registers whose value changed since the previous read are pushed
+    const changes = {};
+    responseData.values.forEach((value, index) => {
+        const register = subscription.config.startingRegister + index;
+        if (subscription.values[register] !== value) {
+            changes[register] = value;
+            subscription.values[register] = value;
+        }
+    });
+    // Register map blocks are pushed whole when any of their values changed
+    const changedBlocks = [];
+    (responseData.blocks || []).forEach((block) => {
+        const key = `${block.functionCode}:${block.address}`;
+        const previous = subscription.blocks[key];
+        if (!previous || previous.values.some((value, index) => value !== block.values[index])) {
+            changedBlocks.push(block);
+            subscription.blocks[key] = block;
+        }
+    });
+    const statusChanged = responseData.connectionStatus !== subscription.connectionStatus
+        || responseData.error !== subscription.error;
+    subscription.connectionStatus = responseData.connectionStatus;
+    subscription.error = responseData.error;
+    if (responseData.timestamp) {
+        subscription.timestamp = responseData.timestamp;
+    }
+
+    if (statusChanged || changedBlocks.length > 0 || Object.keys(changes).length > 0) {
+        broadcast({
+            id: subscription.config.id,
+            timestamp: responseData.timestamp || new Date().toISOString(),
+            values: changes,
+            blocks: changedBlocks,
+            connectionStatus: responseData.connectionStatus,
+            error: responseData.error
+        });
+    }
+};
+
+const stopSubscription = (id) => {
+    const subscription = subscriptions.get(String(id));
+    if (subscription) {
+        subscription.stopped = true;
+        clearTimeout(subscription.timer);
+        subscriptions.delete(String(id));
+    }
+    return Boolean(subscription);
+};
+
+const startSubscription = (config) => {
+    stopSubscription(config.id);
+    const subscription = {
+        config,
+        intervalMs: Math.max(Number(config.intervalMs) || 1000, MIN_SUBSCRIPTION_INTERVAL_MS),
+        values: {},
+        blocks: {},
+        timestamp: null,
+        connectionStatus: 'disconnected',
+        error: null,
+        timer: null,
+        stopped: false
+    };
+    subscriptions.set(String(config.id), subscription);
+    pollSubscription(subscription);
+    return subscription;
+};
+
+// Register (or replace) a subscription: { id, ip, port, slaveId, startingRegister, numberOfRegisters, intervalMs }
+app.post("/subscriptions", (req, res) => {
+    const config = req.body;
+    if (!isValidConfig(config) || config.id === undefined) {
+        log.warn("❌ Invalid subscription request: Missing id or configuration parameters in body", req.body);
+        return res.status(400).json({
+            error: "Invalid request",
+            message: "Missing subscription parameters (id, ip, port, slaveId, startingRegister, numberOfRegisters)"
+        });
+    }
+
+    const subscription = startSubscription(config);
+    saveSubscriptions();
+
+    log.info(`Subscribed device ${config.id} (${config.ip}:${config.port}) every ${subscription.intervalMs} ms`);
+    res.json({ id: config.id, status: 'subscribed' });
+});
+
+app.get("/subscriptions", (req, res) => {
+    res.json({
+        subscriptions: Array.from(subscriptions.values()).map((subscription) => ({
+            ...subscription.config,
+            intervalMs: subscription.intervalMs,
+            connectionStatus: subscription.connectionStatus
+        }))
+    });
+});
+
+app.delete("/subscriptions/:id", (req, res) => {
+    const removed = stopSubscription(req.params.id);
+    if (removed) {
+        saveSubscriptions();
+    }
+    res.status(removed ? 200 : 404).json({ id: req.params.id, status: removed ? 'unsubscribed' : 'unknown' });
+});
+
+// Server-Sent Events channel carrying the changes of every subscription
+app.get("/stream", (req, res) => {
+    res.writeHead(200, {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'Connection': 'keep-alive'
+    });
+
+    // Tell the client where the log stands, then replay the current values so a
+    // reconnecting client catches up. Snapshots carry no sequence number.
+    sendEvent(res, 'hello', { epoch: buffer.epoch, lastSeq: buffer.lastSeq });
+    for (const subscription of subscriptions.values()) {
+        if (subscription.timestamp) {
+            sendEvent(res, 'data', subscriptionSnapshot(subscription));
+        }
+    }
+    streamClients.add(res);
+
+    const heartbeat = setInterval(() => res.write(':\n\n'), STREAM_HEARTBEAT_MS);
+    req.on('close', () => {
+        clearInterval(heartbeat);
+        streamClients.delete(res);
+    });
+    log.info(`Stream client connected (${streamClients.size} connected)`);
+});
+
+// Events of the store-and-forward log after a sequence number, oldest first
+app.get("/buffer", (req, res) => {
+    const after = Number(req.query.after) || 0;
+    const limit = Math.min(Number(req.query.limit) || BUFFER_READ_LIMIT, BUFFER_READ_LIMIT);
+    const events = readBuffer(after, limit);
+    res.json({
+        epoch: buffer.epoch,
+        lastSeq: buffer.lastSeq,
+        firstSeq: buffer.segments.length > 0 ? buffer.segments[0].firstSeq : buffer.lastSeq + 1,
+        events
+    });
+});
+
+// Acknowledge the events stored by Odoo up to a sequence number
+app.post("/buffer/ack", (req, res) => {
+    const seq = Number(req.body && req.body.seq);
+    if (!Number.isInteger(seq) || (req.body.epoch && req.body.epoch !== buffer.epoch)) {
+        return res.status(400).json({ error: "Invalid request", message: "Body must be { epoch, seq } of this log" });
+    }
+    if (seq > buffer.ackedSeq) {
+        buffer.ackedSeq = Math.min(seq, buffer.lastSeq);
+        saveBufferMeta();
+        trimBuffer();
+    }
+    res.json({ epoch: buffer.epoch, ackedSeq: buffer.ackedSeq });
+});
+
+// Prometheus text exposition of the stage timings and of the bridge state
+app.get("/metrics", (req, res) => {
+    const lines = [
+        `# HELP modbus_bridge_stage_seconds Duration of the stages of a device read, quantiles over the last ${METRICS_WINDOW_SIZE} reads`,
+        '# TYPE modbus_bridge_stage_seconds summary'
+    ];
+    for (const timing of stageTimings.values()) {
+        const labels = `plc="${timing.plc}",stage="${timing.stage}"`;
+        const sorted = [...timing.samples].sort((a, b) => a - b);
+        for (const q of [0.5, 0.95, 0.99]) {
+            lines.push(`modbus_bridge_stage_seconds{${labels},quantile="${q}"} ${quantile(sorted, q) / 1000}`);
+        }
+        lines.push(`modbus_bridge_stage_seconds_sum{${labels}} ${timing.sum / 1000}`);
+        lines.push(`modbus_bridge_stage_seconds_count{${labels}} ${timing.count}`);
+    }
+    lines.push('# HELP modbus_bridge_read_errors_total Failed device reads');
+    lines.push('# TYPE modbus_bridge_read_errors_total counter');
+    for (const [plc, count] of readErrors) {
+        lines.push(`modbus_bridge_read_errors_total{plc="${plc}"} ${count}`);
+    }
+    const openConnections = Array.from(endpoints.values()).filter((endpoint) => endpoint.client && endpoint.client.isOpen).length;
+    lines.push('# HELP modbus_bridge_open_connections Open PLC connections');
+    lines.push('# TYPE modbus_bridge_open_connections gauge');
+    lines.push(`modbus_bridge_open_connections ${openConnections}`);
+    lines.push('# HELP modbus_bridge_queued_requests Requests waiting for a free slot on their endpoint');
+    lines.push('# TYPE modbus_bridge_queued_requests gauge');
+    for (const endpoint of endpoints.values()) {
+        lines.push(`modbus_bridge_queued_requests{endpoint="${endpoint.key}"} ${endpoint.queue.length}`);
+    }
+    lines.push('# HELP modbus_bridge_subscriptions Devices polled by the bridge in streaming mode');
+    lines.push('# TYPE modbus_bridge_subscriptions gauge');
+    lines.push(`modbus_bridge_subscriptions ${subscriptions.size}`);
+    lines.push('# HELP modbus_bridge_stream_clients Connected /stream clients');
+    lines.push('# TYPE modbus_bridge_stream_clients gauge');
+    lines.push(`modbus_bridge_stream_clients ${streamClients.size}`);
+    lines.push('# HELP modbus_bridge_buffer_pending_events Logged events not yet acknowledged by Odoo');
+    lines.push('# TYPE modbus_bridge_buffer_pending_events gauge');
+    lines.push(`modbus_bridge_buffer_pending_events ${buffer.lastSeq - buffer.ackedSeq}`);
+    lines.push('# HELP modbus_bridge_buffer_bytes Size of the store-and-forward log');
+    lines.push('# TYPE modbus_bridge_buffer_bytes gauge');
+    lines.push(`modbus_bridge_buffer_bytes ${buffer.segments.reduce((sum, segment) => sum + segment.bytes, 0)}`);
+
+    res.type('text/plain; version=0.0.4').send(lines.join('\n') + '\n');
+});
+
+// Resume the log and the subscriptions of the previous run
+openBuffer();
+try {
+    for (const config of JSON.parse(fs.readFileSync(SUBSCRIPTIONS_FILE, 'utf8'))) {
+        startSubscription(config);
+    }
+    log.info(`Resumed ${subscriptions.size} subscriptions`);
+} catch (error) {
+    if (error.code !== 'ENOENT') {
+        log.error(`❌ Could not resume the subscriptions from ${SUBSCRIPTIONS_FILE}:`, error.message);
+    }
+}
+
 // Start the server
 app.listen(port, () => {
-    console.log(`🌐 REST API running at http://host.docker.internal:${port}`);
-    console.log(`📝 Data endpoint: POST http://host.docker.internal:${port}/data (requires config in body)`);
-    console.log("API server is ready to receive data requests with device configurations.");
+    log.info(`🌐 REST API running at http://host.docker.internal:${port}`);
+    log.info(`📝 Data endpoint: POST http://host.docker.internal:${port}/data (requires config in body)`);
+    log.info(`📝 Batch endpoint: POST http://host.docker.internal:${port}/data/batch (requires device list in body)`);
+    log.info(`📝 Stream endpoint: GET http://host.docker.internal:${port}/stream (changes of POST /subscriptions)`);
+    log.info(`📝 Metrics endpoint: GET http://host.docker.internal:${port}/metrics (Prometheus text format)`);
+    log.info("API server is ready to receive data requests with device configurations.");
 });
\ No newline at end of file
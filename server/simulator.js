@@ -0,0 +1,162 @@
+// Simulated fleet of Modbus TCP slaves, used to benchmark the bridge and Odoo without PLCs.
+//
+//   node simulator.js --devices 100 --registers 100 --latency-ms 5 --interval-ms 1000
+//
+// Device i answers as slave id (i % slavesPerPort) + 1 on port basePort + floor(i / slavesPerPort),
+// so --slaves-per-port > 1 simulates serial gateways. Holding and input registers hold
+// (address + slave id * 100 + seconds since the epoch) & 0xffff, so values change every second.
+//
+// Commands read line by line on stdin:
+//   reset   forget the request statistics (end of a warm-up)
+//   report  print one JSON line with the request statistics since the last reset
+// Once every port listens, one "ready" JSON line is printed.
+const ModbusRTU = require("modbus-serial");
+const { performance } = require("perf_hooks");
+const readline = require("readline");
+
+const DEFAULTS = {
+    devices: 10,
+    registers: 100,
+    latencyMs: 0,
+    jitterMs: 0,
+    intervalMs: 1000,
+    basePort: 15020,
+    slavesPerPort: 1,
+    host: "127.0.0.1"
+};
+
+const parseArgs = (argv) => {
+    const options = { ...DEFAULTS };
+    for (let i = 0; i < argv.length; i += 2) {
+        // --latency-ms -> latencyMs
+        const name = argv[i].replace(/^--/, "").replace(/-([a-z])/g, (_, c) => c.toUpperCase());
+        if (!(name in DEFAULTS) || argv[i + 1] === undefined) {
+            console.error(`Unknown or incomplete option ${argv[i]}`);
+            process.exit(2);
+        }
+        options[name] = typeof DEFAULTS[name] === "number" ? Number(argv[i + 1]) : argv[i + 1];
+    }
+    return options;
+};
+
+const options = parseArgs(process.argv.slice(2));
+
+// Statistics since the last reset; a poll is the first request of a device after at
+// least half an interval, the other requests of the same poll (register blocks) only count
+// as requests
+let stats;
+const resetStats = () => {
+    stats = { startedAt: performance.now(), requests: 0, polls: 0, lastPollAt: new Map(), jitterMs: [] };
+};
+resetStats();
+
+const recordRequest = (port, unitId) => {
+    const now = performance.now();
+    const key = `${port}:${unitId}`;
+    const last = stats.lastPollAt.get(key);
+    stats.requests++;
+    if (last === undefined || now - last >= options.intervalMs / 2) {
+        stats.polls++;
+        if (last !== undefined) {
+            stats.jitterMs.push(Math.abs(now - last - options.intervalMs));
+        }
+        stats.lastPollAt.set(key, now);
+    }
+};
+
+const percentile = (sorted, q) => {
+    if (sorted.length === 0) {
+        return null;
+    }
+    return sorted[Math.max(1, Math.ceil(sorted.length * q / 100)) - 1];
+};
+
+const report = () => {
+    const jitter = [...stats.jitterMs].sort((a, b) => a - b);
+    return {
+        elapsedMs: performance.now() - stats.startedAt,
+        requests: stats.requests,
+        polls: stats.polls,
+        devicesPolled: stats.lastPollAt.size,
+        jitterMs: {
+            p50: percentile(jitter, 50),
+            p95: percentile(jitter, 95),
+            p99: percentile(jitter, 99),
+            max: jitter.length > 0 ? jitter[jitter.length - 1] : null
+        }
+    };
+};
+
+const answerLater = (callback, value) => {
+    const delay = options.latencyMs + Math.random() * options.jitterMs;
+    if (delay > 0) {
+        setTimeout(() => callback(null, value), delay);
+    } else {
+        callback(null, value);
+    }
+};
+
+const registerValue = (address, unitId) => (address + unitId * 100 + Math.floor(Date.now() / 1000)) & 0xffff;
+
+const checkRange = (address, length, callback) => {
+    if (address + length > options.registers) {
+        // Modbus exception 2, illegal data address
+        callback({ modbusErrorCode: 2, msg: "Illegal data address" });
+        return false;
+    }
+    return true;
+};
+
+const createVector = (port) => {
+    const readRegisters = (address, length, unitId, callback) => {
+        recordRequest(port, unitId);
+        if (checkRange(address, length, callback)) {
+            answerLater(callback, Array.from({ length }, (_, i) => registerValue(address + i, unitId)));
+        }
+    };
+    const readBit = (address, unitId, callback) => {
+        if (checkRange(address, 1, callback)) {
+            answerLater(callback, (address + unitId) % 2 === 1);
+        }
+    };
+    return {
+        getMultipleHoldingRegisters: readRegisters,
+        getMultipleInputRegisters: readRegisters,
+        // Single register reads do not go through the multiple register handlers
+        getHoldingRegister: (address, unitId, callback) =>
+            readRegisters(address, 1, unitId, (err, values) => callback(err, values && values[0])),
+        getInputRegister: (address, unitId, callback) =>
+            readRegisters(address, 1, unitId, (err, values) => callback(err, values && values[0])),
+        getCoil: readBit,
+        getDiscreteInput: readBit
+    };
+};
+
+const portCount = Math.ceil(options.devices / options.slavesPerPort);
+let listening = 0;
+for (let i = 0; i < portCount; i++) {
+    const port = options.basePort + i;
+    // unitID 255 answers every slave id
+    const server = new ModbusRTU.ServerTCP(createVector(port), { host: options.host, port, unitID: 255 });
+    server.on("initialized", () => {
+        listening++;
+        if (listening === portCount) {
+            console.log(JSON.stringify({ ready: true, ports: portCount, devices: options.devices }));
+        }
+    });
+    server.on("serverError", (err) => {
+        console.error(`Simulated slave on port ${port} failed: ${err.message}`);
+        process.exit(1);
+    });
+    server.on("socketError", () => {});
+}
+
+readline.createInterface({ input: process.stdin }).on("line", (line) => {
+    const command = line.trim();
+    if (command === "reset") {
+        resetStats();
+        console.log(JSON.stringify({ reset: true }));
+    } else if (command === "report") {
+        console.log(JSON.stringify(report()));
+    }
+});
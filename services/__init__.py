@@ -0,0 +1,8 @@
+from . import bridge_client
+from . import bulk_actions
+from . import diagnostics
+from . import historian
+from . import metrics
+from . import poll_scheduler
+from . import register_map
+from . import stream_listener
\ No newline at end of file
@@ -0,0 +1,44 @@
+# Outcomes of a poll, reported by modbus.device._poll_devices to the scheduler
+CHANGED = 'changed'
+STATIC = 'static'
+ERROR = 'error'
+
+# An adaptive device is polled twice as often as soon as its values change,
+# slows down gradually while they stay the same and backs off faster on errors
+SPEEDUP_FACTOR = 0.5
+SLOWDOWN_FACTOR = 1.25
+ERROR_BACKOFF_FACTOR = 2.0
+
+
+def next_interval(interval, outcome, min_interval, max_interval):
+    """Return the polling interval of an adaptive device after a poll with ``outcome``."""
+    if outcome == CHANGED:
+        interval *= SPEEDUP_FACTOR
+    elif outcome == ERROR:
+        interval *= ERROR_BACKOFF_FACTOR
+    else:
+        interval *= SLOWDOWN_FACTOR
+    return min(max(interval, min_interval), max_interval)
+
+
+class TokenBucket:
+    """Budget of polls per second of one gateway (PLC endpoint).
+
+    Holds at most one second worth of tokens (and at least one), so idle time
+    does not build up a burst larger than the budget.
+    """
+
+    def __init__(self, rate, now):
+        self.rate = rate
+        self.capacity = max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = now
+
+    def take(self, now):
+        """Take a token; return 0 on success, else the seconds until one is available."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
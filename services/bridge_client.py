@@ -0,0 +1,106 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Keep-alive connections kept per bridge host by each session
+POOL_MAXSIZE = 16
+# Bridges read at once by the bulk actions (test / fetch many devices)
+BULK_MAX_WORKERS = 32
+# Seconds allowed to open the TCP connection to the bridge
+CONNECT_TIMEOUT = 3
+# Seconds of a batch timeout left to the bridge to answer once the per-device
+# deadline has passed
+BATCH_DEADLINE_MARGIN = 2
+
+_local = threading.local()
+_bulk_executor = None
+_bulk_executor_lock = threading.Lock()
+
+
+def get_session():
+    """Return the keep-alive HTTP session of the current thread.
+
+    Sessions are kept per thread since requests.Session is not guaranteed to
+    be thread-safe; the scheduler and Odoo reuse their threads, so each of
+    them keeps its connections to the bridge open across polls.
+    """
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _local.session = session
+    return session
+
+
+def post(api_url, path, payload, timeout=10):
+    """POST a JSON payload to the bridge and return the decoded JSON response."""
+    response = get_session().post(f"{api_url}{path}", json=payload, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+
+def read_device(api_url, config, timeout=10):
+    """Read one device through ``POST /data``."""
+    return post(api_url, '/data', config, timeout=timeout)
+
+
+def read_devices(api_url, configs, timeout=10):
+    """Read several devices concurrently through ``POST /data/batch``.
+
+    Every config carries an ``id`` key; the result maps each id (as a string)
+    to the same response ``POST /data`` returns for that device. Devices
+    that do not answer in time get a timeout error of their own, so slow
+    devices do not fail the whole batch.
+    """
+    # requests takes a single timeout or a (connect, read) pair
+    read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+    deadline_ms = max(read_timeout - BATCH_DEADLINE_MARGIN, read_timeout / 2) * 1000
+    data = post(api_url, '/data/batch', {'devices': configs, 'deadlineMs': deadline_ms}, timeout=timeout)
+    return data.get('results', {})
+
+
+def read_devices_concurrently(jobs, timeout=10):
+    """Read devices with one ``POST /data/batch`` per bridge, the bridges in parallel.
+
+    ``jobs`` maps a key (a device id) to ``(api_url, config)``. Yields
+    ``(key, response, error)`` for every device of a bridge once its batch
+    completes, ``error`` being the exception of a failed request. The bridge
+    reads the devices of a batch concurrently and answers each one within
+    its deadline, so the whole set takes about one ``timeout`` (seconds)
+    whatever the number of devices.
+    """
+    configs_by_bridge = {}
+    for key, (api_url, config) in jobs.items():
+        configs_by_bridge.setdefault(api_url, []).append(dict(config, id=key))
+    executor = _get_bulk_executor()
+    futures = {
+        executor.submit(read_devices, api_url, configs, (min(CONNECT_TIMEOUT, timeout), timeout)): configs
+        for api_url, configs in configs_by_bridge.items()
+    }
+    for future in as_completed(futures):
+        configs = futures[future]
+        try:
+            results = future.result()
+        except Exception as e:
+            for config in configs:
+                yield config['id'], None, e
+            continue
+        for config in configs:
+            response = results.get(str(config['id'])) or {
+                'error': 'Device missing from batch response',
+                'connectionStatus': 'error',
+            }
+            yield config['id'], response, None
+
+
+def _get_bulk_executor():
+    # Long-lived threads keep their keep-alive sessions across bulk actions
+    global _bulk_executor
+    with _bulk_executor_lock:
+        if _bulk_executor is None:
+            _bulk_executor = ThreadPoolExecutor(max_workers=BULK_MAX_WORKERS, thread_name_prefix='modbus-bulk')
+        return _bulk_executor
@@ -0,0 +1,41 @@
+import logging
+import threading
+
+import odoo
+from odoo import api
+
+from . import bridge_client
+
+_logger = logging.getLogger(__name__)
+
+
+def start(db_name, uid, action, jobs, timeout):
+    """Run a bulk ``action`` ('test' or 'fetch') on devices in a background thread.
+
+    ``jobs`` maps each device id to the ``(api_url, config)`` of its read.
+    Every device is read concurrently with its own ``timeout``; each result
+    is written in its own transaction and reported to the user over the bus.
+    """
+    thread = threading.Thread(
+        target=_run, args=(db_name, uid, action, jobs, timeout),
+        name=f'modbus-bulk-{action}-{db_name}', daemon=True)
+    thread.start()
+
+
+def _run(db_name, uid, action, jobs, timeout):
+    registry = odoo.registry(db_name)
+    outcomes = {}
+    for device_id, data, error in bridge_client.read_devices_concurrently(jobs, timeout):
+        try:
+            with registry.cursor() as cr:
+                env = api.Environment(cr, uid, {})
+                outcomes[device_id] = env['modbus.device'].browse(device_id)._apply_bulk_result(action, data, error)
+        except Exception as e:
+            _logger.error("Could not store the %s result of Modbus device %s: %s", action, device_id, e)
+            outcomes[device_id] = False
+    try:
+        with registry.cursor() as cr:
+            env = api.Environment(cr, uid, {})
+            env['modbus.device']._notify_bulk_done(action, outcomes)
+    except Exception as e:
+        _logger.error("Could not report the Modbus %s of %d devices: %s", action, len(jobs), e)
@@ -0,0 +1,20 @@
+import threading
+
+# Default for the modbus_trace_every option: one poll out of N of each device
+# is traced when the modbus_connector loggers are at DEBUG level
+DEFAULT_TRACE_EVERY = 100
+
+# (db_name, device_id) -> polls since the last traced one
+_counters = {}
+_lock = threading.Lock()
+
+
+def sample(db_name, device_id, every):
+    """Tell whether this poll of a device is one of the ``1 / every`` traced."""
+    if every <= 1:
+        return True
+    key = (db_name, device_id)
+    with _lock:
+        count = _counters.get(key, 0)
+        _counters[key] = (count + 1) % every
+    return count == 0
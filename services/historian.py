@@ -0,0 +1,70 @@
+import threading
+from collections import namedtuple
+
+StoragePolicy = namedtuple('StoragePolicy', ['mode', 'deadband', 'heartbeat'])
+STORE_ALL = StoragePolicy('all', 0.0, 0)
+
+# db_name -> {(device_id, register_number, register_id): (value, timestamp)} of the
+# last value written to modbus.data for each point
+_last_stored = {}
+_lock = threading.Lock()
+
+
+def should_store(policy, previous, value, timestamp):
+    """Tell whether a sample passes the storage policy of its point.
+
+    ``previous`` is the ``(value, timestamp)`` last stored for the point, or
+    None when unknown (first sample after a restart), in which case the
+    sample is always kept. ``policy.heartbeat`` (seconds) forces a row when
+    the point has not been stored for that long, even if unchanged.
+    """
+    if previous is None or policy.mode == 'all':
+        return True
+    last_value, last_timestamp = previous
+    if policy.heartbeat and (timestamp - last_timestamp).total_seconds() >= policy.heartbeat:
+        return True
+    if policy.mode == 'change':
+        return value != last_value
+    if policy.mode == 'deadband_abs':
+        return abs(value - last_value) > policy.deadband
+    if policy.mode == 'deadband_pct':
+        if not last_value:
+            return value != last_value
+        return abs(value - last_value) > abs(last_value) * policy.deadband / 100.0
+    return True
+
+
+class StorageFilter:
+    """Filter the samples of one ingestion batch against the last stored values.
+
+    Accepted samples are only recorded in the shared cache by ``commit()``, to
+    be called once the rows are committed, so a rolled back batch does not
+    hide the next samples.
+    """
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self._accepted = {}
+
+    def accept(self, key, policy, value, timestamp):
+        previous = self._accepted.get(key)
+        if previous is None:
+            with _lock:
+                previous = _last_stored.get(self.db_name, {}).get(key)
+        if not should_store(policy, previous, value, timestamp):
+            return False
+        self._accepted[key] = (value, timestamp)
+        return True
+
+    def commit(self):
+        with _lock:
+            _last_stored.setdefault(self.db_name, {}).update(self._accepted)
+        self._accepted = {}
+
+
+def forget_device(db_name, device_id):
+    """Drop the cached values of a device, e.g. after its history was cleared."""
+    with _lock:
+        cache = _last_stored.get(db_name, {})
+        for key in [key for key in cache if key[0] == device_id]:
+            del cache[key]
@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Stages of a poll cycle, timed per device
+STAGES = ('bridge_http', 'plc_read', 'decode', 'db_write', 'dispatch', 'cycle')
+# Number of most recent samples the percentiles of a device/stage are computed over
+WINDOW_SIZE = 1024
+
+# db_name -> {(device_id, stage): _Window}
+_windows = {}
+_lock = threading.Lock()
+
+
+class _Window:
+    __slots__ = ('samples', 'count', 'dirty')
+
+    def __init__(self):
+        self.samples = deque(maxlen=WINDOW_SIZE)
+        self.count = 0
+        self.dirty = False
+
+
+def record(db_name, device_ids, stage, seconds):
+    """Add one duration of ``stage`` to each device of ``device_ids``.
+
+    Batch stages (one bridge request, one INSERT for several devices) are
+    charged in full to every device of the batch, as each of them waited
+    for it.
+    """
+    with _lock:
+        windows = _windows.setdefault(db_name, {})
+        for device_id in device_ids:
+            window = windows.get((device_id, stage))
+            if window is None:
+                window = windows[(device_id, stage)] = _Window()
+            window.samples.append(seconds)
+            window.count += 1
+            window.dirty = True
+
+
+@contextmanager
+def timed(db_name, device_ids, stage):
+    """Context manager recording the time spent in its block as ``stage``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(db_name, device_ids, stage, time.perf_counter() - start)
+
+
+def percentile(sorted_samples, q):
+    """Nearest-rank percentile ``q`` (0-100) of a sorted, non-empty list."""
+    rank = max(1, -(-len(sorted_samples) * q // 100))
+    return sorted_samples[rank - 1]
+
+
+def collect(db_name):
+    """Return the stats of the device/stages timed since the previous call.
+
+    Returns ``{(device_id, stage): (count, p50, p95, p99, max)}`` with the
+    durations in seconds over the last ``WINDOW_SIZE`` samples, ``count``
+    being the number of samples since the process started.
+    """
+    with _lock:
+        snapshot = {
+            key: (window.count, sorted(window.samples))
+            for key, window in _windows.get(db_name, {}).items() if window.dirty
+        }
+        for key in snapshot:
+            _windows[db_name][key].dirty = False
+    return {
+        key: (count, percentile(samples, 50), percentile(samples, 95), percentile(samples, 99), samples[-1])
+        for key, (count, samples) in snapshot.items()
+    }
+
+
+def reset(db_name):
+    """Forget the timings recorded for a database, e.g. at the end of a benchmark warm-up."""
+    with _lock:
+        _windows.pop(db_name, None)
+
+
+def summarize(db_name, device_ids):
+    """Return the timings of several devices merged per stage.
+
+    Returns ``{stage: (count, p50, p95, p99, max)}`` in seconds over the
+    samples still in the windows of ``device_ids``, ``count`` being the
+    number of samples recorded since the last ``reset``.
+    """
+    device_ids = set(device_ids)
+    merged = {}
+    with _lock:
+        for (device_id, stage), window in _windows.get(db_name, {}).items():
+            if device_id in device_ids:
+                count, samples = merged.get(stage, (0, []))
+                samples.extend(window.samples)
+                merged[stage] = (count + window.count, samples)
+    summary = {}
+    for stage, (count, samples) in merged.items():
+        samples.sort()
+        summary[stage] = (count, percentile(samples, 50), percentile(samples, 95), percentile(samples, 99), samples[-1])
+    return summary
@@ -0,0 +1,374 @@
+import heapq
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+
+import odoo
+from odoo import api, SUPERUSER_ID
+from odoo.tools import config
+
+from . import adaptive_polling, metrics
+from .stream_listener import StreamListener
+
+_logger = logging.getLogger(__name__)
+
+# Key of the PostgreSQL advisory lock held by the process that runs the polling
+# loop, so only one Odoo worker polls a database at a time
+SCHEDULER_LOCK_KEY = 0x6D6F6462
+# How often (seconds) the polling devices are re-read from the database
+RESYNC_INTERVAL = 5.0
+# How often (seconds) a follower retries to become the polling leader
+LEADER_RETRY_INTERVAL = 10.0
+# Lower bound for polling_interval (ms) to protect the PLCs and the bridge
+MIN_POLLING_INTERVAL_MS = 100
+DEFAULT_POLL_WORKERS = 8
+# How often (seconds) the stage timings of this process are written to modbus.poll.stats
+STATS_FLUSH_INTERVAL = 10.0
+# ir.config_parameter holding the polls per second allowed per gateway (PLC
+# ip:port, shared by every slave id behind it); 0 or unset means no limit
+GATEWAY_BUDGET_PARAM = 'modbus_connector.gateway_max_polls_per_second'
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(db_name):
+    """Return the polling scheduler of a database, creating it if needed."""
+    with _schedulers_lock:
+        scheduler = _schedulers.get(db_name)
+        if scheduler is None:
+            scheduler = _schedulers[db_name] = PollScheduler(db_name)
+        return scheduler
+
+
+class PollScheduler:
+    """Single polling loop for every ``modbus.device`` with ``is_polling`` set.
+
+    The loop keeps a priority queue of next-due times and hands due devices to
+    a bounded thread pool, so the number of threads and database cursors no
+    longer grows with the number of devices. Polling state lives in the
+    database: whichever process holds the advisory lock resumes all devices
+    flagged ``is_polling``, which also covers Odoo restarts.
+
+    Adaptive devices get their interval adjusted after every poll from its
+    outcome, within their minimum and maximum. Every due poll also takes a
+    token from the budget of its gateway; polls over budget are deferred.
+    """
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self.max_workers = int(config.get('modbus_poll_workers') or DEFAULT_POLL_WORKERS)
+        self._heap = []         # (next_due, device_id), monotonic clock
+        self._due = {}          # device_id -> next_due of its live heap entry, older entries are skipped
+        self._intervals = {}    # device_id -> interval in seconds
+        self._adaptive = {}     # device_id -> (min, max) interval in seconds of adaptive devices
+        self._published = {}    # device_id -> interval (ms) last written to current_polling_interval
+        self._bridges = {}      # device_id -> api_url of the bridge serving it
+        self._gateways = {}     # device_id -> (plc_ip, plc_port)
+        self._budgets = {}      # (plc_ip, plc_port) -> TokenBucket
+        self._gateway_rate = 0.0
+        self._listeners = {}    # api_url -> StreamListener of the streaming devices
+        self._inflight = set()  # device ids currently being read
+        self._condition = threading.Condition()
+        self._resync_requested = True
+        self._thread = None
+        self._executor = None
+        self._lock_cnx = None
+
+    def start(self):
+        with self._condition:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name=f'modbus-scheduler-{self.db_name}', daemon=True)
+            self._thread.start()
+
+    def wakeup(self):
+        """Re-read the polling devices right away (after start/stop actions)."""
+        with self._condition:
+            self._resync_requested = True
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            try:
+                if self._acquire_leadership():
+                    _logger.info("Modbus polling scheduler running for database %s", self.db_name)
+                    self._loop()
+            except Exception as e:
+                _logger.error("Modbus polling scheduler for database %s failed: %s", self.db_name, e)
+                self._release_leadership()
+            # Followers still publish the timings of manual fetches made in this process
+            self._flush_stats()
+            time.sleep(LEADER_RETRY_INTERVAL)
+
+    def _acquire_leadership(self):
+        # The session-level lock lives as long as its connection: hold it on a
+        # connection of its own rather than one of the Odoo pool, which would
+        # keep the lock (and the leadership) when merely given back to the pool
+        _db_name, connection_info = odoo.sql_db.connection_info_for(self.db_name)
+        cnx = psycopg2.connect(**connection_info)
+        try:
+            # Autocommit keeps the connection from sitting idle in a transaction
+            cnx.autocommit = True
+            with cnx.cursor() as cr:
+                cr.execute("SELECT pg_try_advisory_lock(%s)", (SCHEDULER_LOCK_KEY,))
+                acquired = cr.fetchone()[0]
+        except Exception:
+            cnx.close()
+            raise
+        if not acquired:
+            cnx.close()
+            return False
+        self._lock_cnx = cnx
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix=f'modbus-poll-{self.db_name}')
+        return True
+
+    def _release_leadership(self):
+        if self._lock_cnx is not None:
+            try:
+                # Closing the connection releases the lock anyway; unlock first
+                # so it is free even if the close does not reach the server
+                with self._lock_cnx.cursor() as cr:
+                    cr.execute("SELECT pg_advisory_unlock(%s)", (SCHEDULER_LOCK_KEY,))
+            except Exception:
+                pass
+            try:
+                self._lock_cnx.close()
+            except Exception:
+                pass
+            self._lock_cnx = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        for listener in self._listeners.values():
+            listener.stop()
+        self._listeners = {}
+        with self._condition:
+            self._heap = []
+            self._due = {}
+            self._intervals = {}
+            self._adaptive = {}
+            self._published = {}
+            self._bridges = {}
+            self._gateways = {}
+            self._budgets = {}
+            self._resync_requested = True
+
+    def _loop(self):
+        next_resync = 0.0
+        next_flush = time.monotonic() + STATS_FLUSH_INTERVAL
+        while True:
+            now = time.monotonic()
+            if self._resync_requested or now >= next_resync:
+                # Fails when the lock connection is gone, handing leadership over
+                with self._lock_cnx.cursor() as cr:
+                    cr.execute("SELECT 1")
+                self._resync(now)
+                next_resync = now + RESYNC_INTERVAL
+            if now >= next_flush:
+                self._executor.submit(self._flush_stats)
+                next_flush = now + STATS_FLUSH_INTERVAL
+
+            # Devices due together behind the same bridge are read with one request
+            due_by_bridge = {}
+            for device_id in self._pop_due(now):
+                due_by_bridge.setdefault(self._bridges.get(device_id), []).append(device_id)
+            for device_ids in due_by_bridge.values():
+                self._dispatch(device_ids)
+
+            with self._condition:
+                wake_at = min(next_resync, next_flush)
+                if self._heap:
+                    wake_at = min(wake_at, self._heap[0][0])
+                timeout = wake_at - time.monotonic()
+                if timeout > 0 and not self._resync_requested:
+                    self._condition.wait(timeout)
+
+    def _resync(self, now):
+        stream_configs = {}
+        with odoo.registry(self.db_name).cursor() as cr:
+            cr.execute("""
+                SELECT id, polling_interval, api_url, acquisition_mode, plc_ip, plc_port,
+                       adaptive_polling, min_polling_interval, max_polling_interval
+                  FROM modbus_device
+                 WHERE is_polling
+            """)
+            rows = []
+            stream_ids = []
+            for device_id, interval, api_url, mode, *row in cr.fetchall():
+                if mode == 'stream':
+                    stream_ids.append(device_id)
+                else:
+                    rows.append((device_id, interval, api_url, *row))
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            for device in env['modbus.device'].browse(stream_ids):
+                stream_configs.setdefault(device.api_url, {})[device.id] = device._get_stream_config()
+            gateway_rate = float(env['ir.config_parameter'].sudo().get_param(GATEWAY_BUDGET_PARAM) or 0)
+        self._update_listeners(stream_configs)
+        with self._condition:
+            self._resync_requested = False
+            intervals = {}
+            adaptive = {}
+            for device_id, interval, _api_url, _ip, _port, is_adaptive, min_interval, max_interval in rows:
+                interval = max(interval or 0, MIN_POLLING_INTERVAL_MS) / 1000.0
+                if is_adaptive:
+                    low = max(min_interval or 0, MIN_POLLING_INTERVAL_MS) / 1000.0
+                    high = max(max_interval or 0, low * 1000) / 1000.0
+                    adaptive[device_id] = (low, high)
+                    # Carry the adapted interval over, within the current bounds
+                    interval = min(max(self._intervals.get(device_id, interval), low), high)
+                intervals[device_id] = interval
+            self._bridges = {row[0]: row[2] for row in rows}
+            self._gateways = {row[0]: (row[3], row[4]) for row in rows}
+            if gateway_rate != self._gateway_rate:
+                self._gateway_rate = gateway_rate
+                self._budgets = {}
+            for device_id in intervals.keys() - self._due.keys():
+                self._schedule(device_id, now)
+            # Stopped devices are dropped lazily when their entry is popped
+            self._intervals = intervals
+            self._adaptive = adaptive
+
+    def _publish_intervals(self, cr):
+        """Write the current interval of the adaptive devices whose rate changed."""
+        with self._condition:
+            current = {
+                device_id: round(self._intervals[device_id] * 1000)
+                for device_id in self._adaptive if device_id in self._intervals
+            }
+        changed = [(device_id, interval) for device_id, interval in current.items()
+                   if self._published.get(device_id) != interval]
+        if changed:
+            cr.execute(f"""
+                UPDATE modbus_device d SET current_polling_interval = v.interval
+                  FROM (VALUES {', '.join(['(%s, %s)'] * len(changed))}) AS v(id, interval)
+                 WHERE d.id = v.id
+            """, [value for row in changed for value in row])
+        self._published = current
+
+    def _schedule(self, device_id, due_at):
+        """Set the next poll of a device, replacing the previous one. Call with the condition held."""
+        self._due[device_id] = due_at
+        heapq.heappush(self._heap, (due_at, device_id))
+
+    def _update_listeners(self, stream_configs):
+        """Keep one stream listener per bridge serving devices in streaming mode."""
+        for api_url in self._listeners.keys() - stream_configs.keys():
+            listener = self._listeners.pop(api_url)
+            # Drop the bridge subscriptions before the listener goes away
+            listener.update_devices({})
+            listener.stop_when_synced()
+        for api_url, configs in stream_configs.items():
+            listener = self._listeners.get(api_url)
+            if listener is None:
+                listener = self._listeners[api_url] = StreamListener(self.db_name, api_url)
+                # Devices first, the buffer drained at start would otherwise be dropped as unknown
+                listener.update_devices(configs)
+                listener.start()
+            else:
+                listener.update_devices(configs)
+
+    def _pop_due(self, now):
+        due = []
+        with self._condition:
+            while self._heap and self._heap[0][0] <= now:
+                due_at, device_id = heapq.heappop(self._heap)
+                if self._due.get(device_id) != due_at:
+                    continue  # replaced by a later _schedule()
+                interval = self._intervals.get(device_id)
+                if interval is None:
+                    del self._due[device_id]
+                    continue
+                if device_id not in self._inflight:
+                    wait = self._take_budget(device_id, now)
+                    if wait:
+                        # Over the budget of its gateway: poll as soon as it allows
+                        self._schedule(device_id, now + wait)
+                        continue
+                # Schedule from the nominal due time rather than from when the
+                # read finished, so slow reads do not make the period drift.
+                # Slots that were missed entirely are skipped, not replayed.
+                missed = int((now - due_at) // interval)
+                self._schedule(device_id, due_at + (missed + 1) * interval)
+                if device_id in self._inflight:
+                    _logger.debug("Skipping poll of device %s: previous read still running", device_id)
+                    continue
+                self._inflight.add(device_id)
+                due.append(device_id)
+        return due
+
+    def _take_budget(self, device_id, now):
+        """Take a poll from the budget of the device gateway; return the seconds to wait if there is none."""
+        if not self._gateway_rate:
+            return 0.0
+        gateway = self._gateways.get(device_id)
+        budget = self._budgets.get(gateway)
+        if budget is None:
+            budget = self._budgets[gateway] = adaptive_polling.TokenBucket(self._gateway_rate, now)
+        return budget.take(now)
+
+    def _adapt(self, outcomes):
+        """Adjust the interval of the adaptive devices from the outcome of their last poll."""
+        with self._condition:
+            for device_id, outcome in outcomes.items():
+                bounds = self._adaptive.get(device_id)
+                interval = self._intervals.get(device_id)
+                if bounds is None or interval is None:
+                    continue
+                new_interval = adaptive_polling.next_interval(interval, outcome, *bounds)
+                self._intervals[device_id] = new_interval
+                # A faster rate applies right away, not after the slow period already scheduled
+                due_at = time.monotonic() + new_interval
+                if new_interval < interval and device_id in self._due and due_at < self._due[device_id]:
+                    self._schedule(device_id, due_at)
+                    self._condition.notify()
+
+    def _dispatch(self, device_ids):
+        future = self._executor.submit(self._poll_devices, device_ids)
+        future.add_done_callback(lambda _future: self._inflight.difference_update(device_ids))
+
+    def _flush_stats(self):
+        try:
+            with odoo.registry(self.db_name).cursor() as cr:
+                env = api.Environment(cr, SUPERUSER_ID, {})
+                env['modbus.poll.stats']._flush_metrics()
+                self._publish_intervals(cr)
+        except Exception as e:
+            _logger.warning("Could not write the Modbus poll timings of database %s: %s", self.db_name, e)
+
+    def _poll_devices(self, device_ids):
+        registry = odoo.registry(self.db_name)
+        start = time.perf_counter()
+        try:
+            with registry.cursor() as cr:
+                env = api.Environment(cr, SUPERUSER_ID, {})
+                devices = env['modbus.device'].browse(device_ids).exists().filtered('is_polling')
+                outcomes = devices._poll_devices() if devices else {}
+                cr.commit()
+            # The whole cycle, from the bridge request to the commit of the rows
+            metrics.record(self.db_name, device_ids, 'cycle', time.perf_counter() - start)
+            self._adapt(outcomes)
+        except Exception as e:
+            if len(device_ids) > 1:
+                # Do not let one faulty device stop the whole batch
+                _logger.warning("Batch poll of devices %s failed (%s), polling them one by one", device_ids, e)
+                for device_id in device_ids:
+                    self._poll_devices([device_id])
+                return
+            device_id = device_ids[0]
+            _logger.error("Polling device %s crashed: %s", device_id, e)
+            self._adapt({device_id: adaptive_polling.ERROR})
+            # Keep polling: a database outage must not stop the acquisition,
+            # values read by the bridge meanwhile are only lost for this cycle
+            try:
+                with registry.cursor() as cr:
+                    env = api.Environment(cr, SUPERUSER_ID, {})
+                    env['modbus.device'].browse(device_id).write({'status': 'error', 'last_error': str(e)})
+                    cr.commit()
+            except Exception as db_error:
+                _logger.debug("Could not flag device %s in error: %s", device_id, db_error)
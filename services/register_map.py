@@ -0,0 +1,99 @@
+import bisect
+import struct
+from collections import namedtuple
+
+# Modbus function code used to read each register type
+FUNCTION_CODES = {
+    'coil': 1,
+    'discrete_input': 2,
+    'holding_register': 3,
+    'input_register': 4,
+}
+# Largest quantity a single read may request (Modbus application protocol PDU limits)
+MAX_READ_COUNT = {1: 2000, 2: 2000, 3: 125, 4: 125}
+# data_type: (number of 16-bit words, struct format); bool is a single coil/input bit
+DATA_TYPES = {
+    'bool': (1, None),
+    'int16': (1, 'h'),
+    'uint16': (1, 'H'),
+    'int32': (2, 'i'),
+    'uint32': (2, 'I'),
+    'float32': (2, 'f'),
+    'float64': (4, 'd'),
+}
+
+TagCodec = namedtuple('TagCodec', [
+    'id', 'function_code', 'address', 'words', 'fmt', 'byte_swap', 'word_swap', 'scale', 'offset',
+])
+
+
+def plan_reads(points, max_gap=0):
+    """Merge ``(function_code, address, count)`` points into the fewest block reads.
+
+    Points of the same function code are merged while the hole between them is
+    at most ``max_gap`` addresses and the block stays within the PDU limit of
+    that function code. Returns a sorted list of ``(function_code, address, count)``.
+    """
+    blocks = []
+    for function_code in sorted({point[0] for point in points}):
+        limit = MAX_READ_COUNT[function_code]
+        start = end = None
+        for _function_code, address, count in sorted(point for point in points if point[0] == function_code):
+            point_end = address + count
+            if start is not None and address - end <= max_gap and max(end, point_end) - start <= limit:
+                end = max(end, point_end)
+                continue
+            if start is not None:
+                blocks.append((function_code, start, end - start))
+            start, end = address, point_end
+        if start is not None:
+            blocks.append((function_code, start, end - start))
+    return blocks
+
+
+def decode_blocks(blocks, codecs):
+    """Decode the tags covered by the returned blocks.
+
+    ``blocks`` is a list of ``(function_code, address, values)`` as read from
+    the device, ``codecs`` a list of ``TagCodec``. Each block is converted to
+    a byte buffer once (in both byte orders when needed) and the tags are then
+    unpacked as slices of it. Returns ``{tag id: scaled value}``; tags not
+    covered by any block are left out.
+    """
+    codecs_by_code = {}
+    for codec in sorted(codecs, key=lambda codec: codec.address):
+        codecs_by_code.setdefault(codec.function_code, []).append(codec)
+    addresses_by_code = {
+        function_code: [codec.address for codec in code_codecs]
+        for function_code, code_codecs in codecs_by_code.items()
+    }
+
+    decoded = {}
+    for function_code, address, values in blocks:
+        block_codecs = codecs_by_code.get(function_code)
+        if not block_codecs or not values:
+            continue
+        end = address + len(values)
+        addresses = addresses_by_code[function_code]
+        first = bisect.bisect_left(addresses, address)
+        last = bisect.bisect_left(addresses, end)
+        in_block = [codec for codec in block_codecs[first:last] if codec.address + codec.words <= end]
+        if not in_block:
+            continue
+
+        if function_code in (1, 2):
+            for codec in in_block:
+                decoded[codec.id] = float(bool(values[codec.address - address])) * codec.scale + codec.offset
+            continue
+
+        count = len(values)
+        big_endian = struct.pack(f'>{count}H', *values)
+        little_endian = struct.pack(f'<{count}H', *values) if any(codec.byte_swap for codec in in_block) else None
+        for codec in in_block:
+            buffer = little_endian if codec.byte_swap else big_endian
+            start = (codec.address - address) * 2
+            raw = buffer[start:start + codec.words * 2]
+            if codec.word_swap:
+                raw = b''.join(raw[i:i + 2] for i in range(len(raw) - 2, -1, -2))
+            decoded[codec.id] = struct.unpack(f'>{codec.fmt}', raw)[0] * codec.scale + codec.offset
+    return decoded
@@ -0,0 +1,328 @@
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+
+import odoo
+from odoo import api, SUPERUSER_ID
+
+from . import bridge_client
+
+_logger = logging.getLogger(__name__)
+
+# Seconds without any bytes on the stream (the bridge sends a heartbeat every
+# 15s) before the connection is considered dead
+STREAM_READ_TIMEOUT = 60
+RECONNECT_DELAY = 5.0
+# Change events are written in batches of at most MAX_BATCH events, collected
+# for at most FLUSH_INTERVAL seconds
+FLUSH_INTERVAL = 0.25
+MAX_BATCH = 1000
+# Events fetched per GET /buffer request when catching up after an outage
+DRAIN_BATCH = 5000
+# Seconds between two acknowledgements of the stored events to the bridge
+ACK_INTERVAL = 5.0
+
+
+def parse_bridge_timestamp(value):
+    """Convert an ISO 8601 timestamp from the bridge to a naive UTC datetime."""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+class StreamListener:
+    """Long-lived consumer of the ``GET /stream`` channel of one bridge.
+
+    The listener registers a subscription for each of its devices; the bridge
+    then polls those PLCs itself and only pushes the registers whose value
+    changed. One thread reads the stream, a second one writes the collected
+    events in batches and keeps the bridge subscriptions in sync.
+
+    Every change event also goes to the store-and-forward log of the bridge
+    under a sequence number. The last number stored is kept in
+    ``modbus.stream.cursor`` in the same transaction as the events, so after
+    an outage of Odoo or of the database the listener drains the log from
+    there before consuming live events again, without gaps or duplicates.
+    """
+
+    def __init__(self, db_name, api_url):
+        self.db_name = db_name
+        self.api_url = api_url
+        self._lock = threading.Lock()
+        self._devices = {}     # device_id -> subscription config wanted
+        self._registered = {}  # device_id -> subscription config known by the bridge
+        self._state = {}       # device_id -> {register_number: value} last received
+        self._block_state = {} # device_id -> {(function_code, address): block} last received
+        self._dirty = threading.Event()
+        self._stop = threading.Event()
+        self._queue = queue.Queue()
+        self._threads = []
+        self._stop_when_synced = False
+        self._store_lock = threading.Lock()
+        self._reconnect = threading.Event()
+        self._epoch = None     # id of the bridge log the sequence numbers belong to
+        self._last_seq = 0     # last sequence number stored in Odoo
+        self._acked_seq = 0
+        self._last_ack = 0.0
+
+    def start(self):
+        for target, name in ((self._read_loop, 'read'), (self._flush_loop, 'flush')):
+            thread = threading.Thread(
+                target=target, name=f'modbus-stream-{name}-{self.api_url}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+
+    def stop_when_synced(self):
+        """Stop once the subscriptions have been synced with the bridge."""
+        self._stop_when_synced = True
+
+    def update_devices(self, configs):
+        """Set the subscriptions wanted on the bridge, as ``{device_id: config}``."""
+        with self._lock:
+            if configs == self._devices:
+                return
+            self._devices = dict(configs)
+            for device_id in list(self._state):
+                if device_id not in configs:
+                    del self._state[device_id]
+            for device_id in list(self._block_state):
+                if device_id not in configs:
+                    del self._block_state[device_id]
+        self._dirty.set()
+
+    def _sync_subscriptions(self):
+        self._dirty.clear()
+        with self._lock:
+            wanted = dict(self._devices)
+            registered = dict(self._registered)
+        for device_id, config in wanted.items():
+            if registered.get(device_id) != config:
+                bridge_client.post(self.api_url, '/subscriptions', config)
+                registered[device_id] = config
+        for device_id in registered.keys() - wanted.keys():
+            bridge_client.get_session().delete(
+                f"{self.api_url}/subscriptions/{device_id}", timeout=10)
+            del registered[device_id]
+        with self._lock:
+            self._registered = registered
+
+    def _read_loop(self):
+        # A bridge that stays down is reported once, not at every reconnect attempt
+        failing = False
+        while not self._stop.is_set():
+            try:
+                with requests.get(f"{self.api_url}/stream", stream=True,
+                                  timeout=(10, STREAM_READ_TIMEOUT)) as response:
+                    response.raise_for_status()
+                    _logger.info("Connected to Modbus API stream at %s", self.api_url)
+                    failing = False
+                    # The bridge may have restarted and lost its subscriptions
+                    with self._lock:
+                        self._registered = {}
+                    self._dirty.set()
+                    self._reconnect.clear()
+                    self._consume(response)
+            except Exception as e:
+                if not self._stop.is_set():
+                    _logger.log(logging.DEBUG if failing else logging.WARNING,
+                                "Modbus API stream at %s interrupted: %s", self.api_url, e)
+                    failing = True
+            self._stop.wait(RECONNECT_DELAY)
+
+    def _consume(self, response):
+        event_type, data_lines = 'message', []
+        for line in response.iter_lines(decode_unicode=True):
+            if self._stop.is_set() or self._reconnect.is_set():
+                return
+            if line is None:
+                continue
+            if not line:
+                # A blank line terminates an event
+                if data_lines and event_type == 'data':
+                    self._queue.put(json.loads('\n'.join(data_lines)))
+                elif data_lines and event_type == 'hello':
+                    # Sent first: catch up on the log before any live event
+                    self._drain(json.loads('\n'.join(data_lines)))
+                event_type, data_lines = 'message', []
+            elif line.startswith(':'):
+                continue  # heartbeat comment
+            elif line.startswith('event:'):
+                event_type = line[6:].strip()
+            elif line.startswith('data:'):
+                data_lines.append(line[5:].lstrip())
+
+    def _flush_loop(self):
+        # Like the stream, a bridge that stays down is reported once until it recovers
+        sync_failing = False
+        while not self._stop.is_set():
+            if self._dirty.is_set():
+                try:
+                    self._sync_subscriptions()
+                    sync_failing = False
+                except Exception as e:
+                    _logger.log(logging.DEBUG if sync_failing else logging.WARNING,
+                                "Could not sync subscriptions with Modbus API at %s: %s", self.api_url, e)
+                    sync_failing = True
+                    self._dirty.set()
+            if self._stop_when_synced and not self._dirty.is_set():
+                self.stop()
+                break
+            try:
+                first = self._queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            payloads = [first]
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            while len(payloads) < MAX_BATCH:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    payloads.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._store(payloads)
+            except Exception as e:
+                _logger.error("Could not store %d stream events from %s: %s", len(payloads), self.api_url, e)
+                self._recover()
+                continue
+            self._ack()
+
+    def _drain(self, hello):
+        """Store the events of the bridge log that Odoo missed, oldest first.
+
+        Runs in the read thread, so live events wait on the socket until the
+        backlog has been stored. Their sequence numbers then tell apart the
+        ones already drained.
+        """
+        with odoo.registry(self.db_name).cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            epoch, after = env['modbus.stream.cursor']._get_cursor(self.api_url)
+        if epoch != hello['epoch']:
+            # New or wiped log on the bridge: everything in it is unseen
+            after = 0
+        with self._store_lock:
+            self._epoch = hello['epoch']
+            self._last_seq = self._acked_seq = after
+        drained = 0
+        while after < hello['lastSeq'] and not self._stop.is_set():
+            response = bridge_client.get_session().get(
+                f"{self.api_url}/buffer", params={'after': after, 'limit': DRAIN_BATCH}, timeout=30)
+            response.raise_for_status()
+            data = response.json()
+            if data['epoch'] != self._epoch:
+                raise RuntimeError("Bridge log changed while draining it")
+            if data['firstSeq'] > after + 1:
+                _logger.warning("Modbus API at %s discarded events %d-%d of its buffer before they were stored",
+                                self.api_url, after + 1, data['firstSeq'] - 1)
+            events = data['events']
+            if not events:
+                break
+            self._store(events)
+            after = events[-1]['seq']
+            drained += len(events)
+        if drained:
+            _logger.info("Stored %d buffered stream events from %s", drained, self.api_url)
+        self._ack(force=True)
+
+    def _recover(self):
+        """Recover from events that could not be stored.
+
+        The events are still in the bridge log: drop the pending ones and
+        reconnect to drain them again.
+        """
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        self._reconnect.set()
+
+    def _ack(self, force=False):
+        """Let the bridge drop the log events stored in Odoo, at most every ``ACK_INTERVAL``."""
+        with self._store_lock:
+            epoch, seq = self._epoch, self._last_seq
+        if not epoch or seq <= self._acked_seq:
+            return
+        if not force and time.monotonic() - self._last_ack < ACK_INTERVAL:
+            return
+        self._last_ack = time.monotonic()
+        try:
+            bridge_client.post(self.api_url, '/buffer/ack', {'epoch': epoch, 'seq': seq}, timeout=5)
+            self._acked_seq = seq
+        except Exception as e:
+            _logger.debug("Could not acknowledge stream events to %s: %s", self.api_url, e)
+
+    def _to_event(self, payload):
+        """Turn a bridge payload into a stream event, keeping only real changes.
+
+        On (re)connection the bridge replays the current values of every
+        subscription; comparing against the last received state keeps those
+        from being stored again.
+        """
+        device_id = int(payload['id'])
+        with self._lock:
+            if device_id not in self._devices:
+                return None
+            state = self._state.setdefault(device_id, {})
+            changes = {}
+            for register_num, value in (payload.get('values') or {}).items():
+                register_num = int(register_num)
+                if state.get(register_num) != value:
+                    changes[register_num] = value
+                    state[register_num] = value
+            # Register map devices stream whole blocks, decoded by the device
+            block_state = self._block_state.setdefault(device_id, {})
+            changed_blocks = []
+            for block in payload.get('blocks') or []:
+                key = (block['functionCode'], block['address'])
+                if block_state.get(key) != block:
+                    changed_blocks.append(block)
+                    block_state[key] = block
+            return {
+                'device_id': device_id,
+                'timestamp': parse_bridge_timestamp(payload.get('timestamp')),
+                'values': changes,
+                'state': dict(state),
+                'blocks': list(block_state.values()),
+                'changed_blocks': changed_blocks,
+                'connection_status': payload.get('connectionStatus', 'error'),
+                'error': payload.get('error'),
+            }
+
+    def _store(self, payloads):
+        with self._store_lock:
+            last_seq = self._last_seq
+            # Only the snapshots sent on connection carry no seq
+            payloads = [payload for payload in payloads if payload.get('seq', last_seq + 1) > last_seq]
+            seq = max((payload.get('seq', 0) for payload in payloads), default=0)
+            events = [event for event in map(self._to_event, payloads) if event]
+            if not events and seq <= last_seq:
+                return
+            try:
+                with odoo.registry(self.db_name).cursor() as cr:
+                    env = api.Environment(cr, SUPERUSER_ID, {})
+                    if events:
+                        env['modbus.device']._store_stream_events(events)
+                    if seq > last_seq:
+                        env['modbus.stream.cursor']._set_cursor(self.api_url, self._epoch, seq)
+                    cr.commit()
+            except Exception:
+                # The changes were not stored: compare the replayed events against nothing
+                with self._lock:
+                    self._state = {}
+                    self._block_state = {}
+                raise
+            self._last_seq = max(seq, last_seq)
@@ -0,0 +1,41 @@
+/** @odoo-module **/
+
+import { registry } from "@web/core/registry";
+
+// Delay (ms) between two reloads of an open device list while bulk results arrive
+const RELOAD_DELAY = 1000;
+
+/**
+ * Shows the per-device results of the bulk Test Connection / Fetch Data
+ * actions pushed over the bus, and reloads the device view they change.
+ */
+export const modbusBulkResultsService = {
+    dependencies: ["bus_service", "notification", "action"],
+
+    start(env, { bus_service, notification, action }) {
+        let reloadTimer = null;
+
+        const reloadDeviceView = () => {
+            reloadTimer = null;
+            const controller = action.currentController;
+            if (controller && controller.action.res_model === "modbus.device") {
+                action.switchView(controller.view.type);
+            }
+        };
+
+        bus_service.subscribe("modbus_connector/device_result", (payload) => {
+            // Successes show up in the reloaded list, failures get a notification each
+            if (!payload.ok) {
+                notification.add(payload.message, {
+                    title: payload.action === "test" ? "Connection Test" : "Fetch Data",
+                    type: "danger",
+                });
+            }
+            if (!reloadTimer) {
+                reloadTimer = setTimeout(reloadDeviceView, RELOAD_DELAY);
+            }
+        });
+    },
+};
+
+registry.category("services").add("modbus_connector.bulk_results", modbusBulkResultsService);
@@ -0,0 +1,2 @@
+from . import test_historian
+from . import test_register_map
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+from odoo.tests.common import BaseCase
+
+from ..services.historian import STORE_ALL, StoragePolicy, should_store
+
+NOW = datetime(2024, 1, 1, 12, 0, 0)
+
+
+class TestShouldStore(BaseCase):
+
+    def test_first_sample_is_kept(self):
+        policy = StoragePolicy('deadband_abs', 10.0, 0)
+        self.assertTrue(should_store(policy, None, 1.0, NOW))
+
+    def test_store_all(self):
+        self.assertTrue(should_store(STORE_ALL, (1.0, NOW), 1.0, NOW))
+
+    def test_change(self):
+        policy = StoragePolicy('change', 0.0, 0)
+        self.assertFalse(should_store(policy, (1.0, NOW), 1.0, NOW))
+        self.assertTrue(should_store(policy, (1.0, NOW), 1.5, NOW))
+
+    def test_deadband_abs(self):
+        policy = StoragePolicy('deadband_abs', 0.5, 0)
+        self.assertFalse(should_store(policy, (10.0, NOW), 10.25, NOW))
+        # The deadband itself is not exceeded
+        self.assertFalse(should_store(policy, (10.0, NOW), 10.5, NOW))
+        self.assertTrue(should_store(policy, (10.0, NOW), 10.75, NOW))
+        self.assertTrue(should_store(policy, (10.0, NOW), 9.25, NOW))
+
+    def test_deadband_pct(self):
+        policy = StoragePolicy('deadband_pct', 5.0, 0)
+        self.assertFalse(should_store(policy, (200.0, NOW), 210.0, NOW))
+        self.assertTrue(should_store(policy, (200.0, NOW), 211.0, NOW))
+        # Relative to the magnitude of negative values
+        self.assertFalse(should_store(policy, (-200.0, NOW), -190.0, NOW))
+        self.assertTrue(should_store(policy, (-200.0, NOW), -189.0, NOW))
+
+    def test_deadband_pct_from_zero(self):
+        policy = StoragePolicy('deadband_pct', 5.0, 0)
+        self.assertFalse(should_store(policy, (0.0, NOW), 0.0, NOW))
+        self.assertTrue(should_store(policy, (0.0, NOW), 0.001, NOW))
+
+    def test_heartbeat(self):
+        policy = StoragePolicy('change', 0.0, 60)
+        self.assertFalse(should_store(policy, (1.0, NOW), 1.0, NOW + timedelta(seconds=59.9)))
+        self.assertTrue(should_store(policy, (1.0, NOW), 1.0, NOW + timedelta(seconds=60)))
+        policy = StoragePolicy('deadband_abs', 5.0, 60)
+        self.assertTrue(should_store(policy, (1.0, NOW), 2.0, NOW + timedelta(minutes=5)))
+
+    def test_no_heartbeat(self):
+        policy = StoragePolicy('change', 0.0, 0)
+        self.assertFalse(should_store(policy, (1.0, NOW), 1.0, NOW + timedelta(days=30)))
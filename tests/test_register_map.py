@@ -0,0 +1,96 @@
+from odoo.tests.common import BaseCase
+
+from ..services.register_map import DATA_TYPES, TagCodec, decode_blocks, plan_reads
+
+
+def codec(tag_id, address, data_type='uint16', function_code=3, byte_swap=False, word_swap=False,
+          scale=1.0, offset=0.0):
+    words, fmt = DATA_TYPES[data_type]
+    return TagCodec(tag_id, function_code, address, words, fmt, byte_swap, word_swap, scale, offset)
+
+
+class TestPlanReads(BaseCase):
+
+    def test_merges_adjacent_points(self):
+        points = [(3, 2, 2), (3, 0, 2), (3, 4, 1)]
+        self.assertEqual(plan_reads(points), [(3, 0, 5)])
+
+    def test_merges_overlapping_points(self):
+        self.assertEqual(plan_reads([(3, 0, 4), (3, 2, 1)]), [(3, 0, 4)])
+
+    def test_gap(self):
+        points = [(3, 0, 2), (3, 5, 2)]
+        # Three unread addresses between the points
+        self.assertEqual(plan_reads(points), [(3, 0, 2), (3, 5, 2)])
+        self.assertEqual(plan_reads(points, max_gap=2), [(3, 0, 2), (3, 5, 2)])
+        self.assertEqual(plan_reads(points, max_gap=3), [(3, 0, 7)])
+
+    def test_function_codes_are_not_merged(self):
+        points = [(4, 0, 1), (3, 1, 1), (3, 0, 1), (1, 0, 1)]
+        self.assertEqual(plan_reads(points), [(1, 0, 1), (3, 0, 2), (4, 0, 1)])
+
+    def test_register_limit(self):
+        points = [(3, address, 1) for address in range(130)]
+        self.assertEqual(plan_reads(points), [(3, 0, 125), (3, 125, 5)])
+        # A two word tag never straddles two blocks
+        self.assertEqual(plan_reads([(4, 0, 124), (4, 124, 2)]), [(4, 0, 124), (4, 124, 2)])
+
+    def test_bit_limit(self):
+        points = [(1, 0, 1), (1, 1999, 1), (1, 2000, 1)]
+        self.assertEqual(plan_reads(points, max_gap=2000), [(1, 0, 2000), (1, 2000, 1)])
+        self.assertEqual(plan_reads([(2, 0, 1), (2, 1999, 1)], max_gap=2000), [(2, 0, 2000)])
+
+    def test_no_points(self):
+        self.assertEqual(plan_reads([]), [])
+
+
+class TestDecodeBlocks(BaseCase):
+
+    def test_float32_word_and_byte_order(self):
+        # 1.5 is 0x3fc00000
+        codecs = [
+            codec(1, 0, 'float32'),
+            codec(2, 2, 'float32', word_swap=True),
+            codec(3, 4, 'float32', byte_swap=True),
+            codec(4, 6, 'float32', byte_swap=True, word_swap=True),
+        ]
+        values = [0x3fc0, 0x0000, 0x0000, 0x3fc0, 0xc03f, 0x0000, 0x0000, 0xc03f]
+        self.assertEqual(decode_blocks([(3, 0, values)], codecs), {1: 1.5, 2: 1.5, 3: 1.5, 4: 1.5})
+
+    def test_integers_scale_and_offset(self):
+        codecs = [
+            codec(1, 10, 'int16', scale=0.1),
+            codec(2, 11, 'uint16', offset=-10.0),
+            codec(3, 12, 'int32'),
+            codec(4, 14, 'uint32', word_swap=True),
+        ]
+        values = [0xfff6, 0xffff, 0xffff, 0xfffe, 0x0001, 0x0000]
+        decoded = decode_blocks([(3, 10, values)], codecs)
+        self.assertAlmostEqual(decoded.pop(1), -1.0)
+        self.assertEqual(decoded, {2: 65525.0, 3: -2, 4: 1})
+
+    def test_float64(self):
+        # 1.0 is 0x3ff0000000000000
+        codecs = [codec(1, 0, 'float64', function_code=4), codec(2, 4, 'float64', function_code=4, word_swap=True)]
+        values = [0x3ff0, 0, 0, 0, 0, 0, 0, 0x3ff0]
+        self.assertEqual(decode_blocks([(4, 0, values)], codecs), {1: 1.0, 2: 1.0})
+
+    def test_bits(self):
+        codecs = [codec(1, 3, 'bool', function_code=1), codec(2, 4, 'bool', function_code=1, scale=5.0)]
+        self.assertEqual(decode_blocks([(1, 3, [False, True])], codecs), {1: 0.0, 2: 5.0})
+
+    def test_tags_outside_blocks(self):
+        codecs = [
+            codec(1, 0),
+            # Second word beyond the block
+            codec(2, 1, 'uint32'),
+            # Same address, other function code
+            codec(3, 0, function_code=4),
+        ]
+        self.assertEqual(decode_blocks([(3, 0, [7, 8])], codecs), {1: 7.0})
+        self.assertEqual(decode_blocks([(3, 0, [])], codecs), {})
+
+    def test_several_blocks(self):
+        codecs = [codec(1, 0), codec(2, 200), codec(3, 100)]
+        blocks = [(3, 200, [2]), (3, 0, [1])]
+        self.assertEqual(decode_blocks(blocks, codecs), {1: 1.0, 2: 2.0})